@@ -99,6 +99,7 @@ def main():
   run_parser.add_argument('conllu_files', nargs='+')
   run_parser.add_argument('--output_dir')
   run_parser.add_argument('--output_filename')
+  run_parser.add_argument('--stream', action='store_true')
   for section_name in section_names:
     run_parser.add_argument('--'+section_name, nargs='+')
     
@@ -250,6 +251,7 @@ def run(**kwargs):
   conllu_files = kwargs.pop('conllu_files')
   output_dir = kwargs.pop('output_dir')
   output_filename = kwargs.pop('output_filename')
+  stream = kwargs.pop('stream')
 
   # Get the cl-defined options
   kwargs = {key: value for key, value in six.iteritems(kwargs) if value is not None}
@@ -268,7 +270,8 @@ def run(**kwargs):
   config_file = os.path.join(save_dir, 'config.cfg')
   kwargs['DEFAULT']['save_dir'] = save_dir
 
-  config = Config(defaults_file='', config_file=config_file, **kwargs)
+  # Options added since the model was trained fall back to their defaults
+  config = Config(config_file=config_file, **kwargs)
   with open('debug.cfg', 'w') as f:
     config.write(f)
   network_class = config.get('DEFAULT', 'network_class')
@@ -276,7 +279,7 @@ def run(**kwargs):
   input_networks, networks = resolve_network_dependencies(config, network_class, network_list, {})
   NetworkClass = getattr(parser, network_class)
   network = NetworkClass(input_networks=input_networks, config=config)
-  network.parse(conllu_files, output_dir=output_dir, output_filename=output_filename)
+  network.parse(conllu_files, output_dir=output_dir, output_filename=output_filename, stream=stream)
   return
 
 #***************************************************************
@@ -20,11 +20,15 @@ from __future__ import division
 from __future__ import print_function
 
 import re
+import sys
 import time
 import os
 import pickle as pkl
 import curses
 import codecs
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
 
 import numpy as np
 import tensorflow as tf
@@ -36,6 +40,7 @@ from parser.neural import nn, nonlin, embeddings, recurrent, classifiers
 from parser.graph_outputs import GraphOutputs, TrainOutputs, DevOutputs
 from parser.structs import conllu_dataset
 from parser.structs import vocabs
+from parser.structs.conllu_columns import CoNLLUColumns
 from parser.neural.optimizers import AdamOptimizer, AMSGradOptimizer
 
 #***************************************************************
@@ -69,6 +74,7 @@ class BaseNetwork(object):
       self._id_vocab = vocabs.IDIndexVocab(config=config)
       extant_vocabs['IDIndexVocab'] = self._id_vocab
 
+    uncounted_vocabs = []
     self._input_vocabs = []
     for input_vocab_classname in self.input_vocab_classes:
       if input_vocab_classname in extant_vocabs:
@@ -76,7 +82,8 @@ class BaseNetwork(object):
       else:
         VocabClass = getattr(vocabs, input_vocab_classname)
         vocab = VocabClass(config=config)
-        vocab.load() or vocab.count(self.train_conllus)
+        if not vocab.load():
+          uncounted_vocabs.append(vocab)
         self._input_vocabs.append(vocab)
         extant_vocabs[input_vocab_classname] = vocab
 
@@ -87,35 +94,72 @@ class BaseNetwork(object):
       else:
         VocabClass = getattr(vocabs, output_vocab_classname)
         vocab = VocabClass(config=config)
-        vocab.load() or vocab.count(self.train_conllus)
+        if not vocab.load():
+          uncounted_vocabs.append(vocab)
         self._output_vocabs.append(vocab)
         extant_vocabs[output_vocab_classname] = vocab
 
     self._throughput_vocabs = []
+    self._raw_columns = []
     for throughput_vocab_classname in self.throughput_vocab_classes:
       if throughput_vocab_classname in extant_vocabs:
         self._throughput_vocabs.append(extant_vocabs[throughput_vocab_classname])
+      elif self.raw_throughput:
+        # Only copied from the input to the output, so nothing has to be counted, indexed or fed
+        VocabClass = getattr(vocabs, throughput_vocab_classname)
+        self._raw_columns.append((VocabClass._field, VocabClass._conllu_idx))
       else:
         VocabClass = getattr(vocabs, throughput_vocab_classname)
         vocab = VocabClass(config=config)
-        vocab.load() or vocab.count(self.train_conllus)
+        if not vocab.load():
+          uncounted_vocabs.append(vocab)
         self._throughput_vocabs.append(vocab)
         extant_vocabs[throughput_vocab_classname] = vocab
+    self.count_vocabs(uncounted_vocabs)
+    self._decode_pool = None
 
     with tf.variable_scope(self.classname, reuse=False):
       self.global_step = tf.Variable(0., trainable=False, name='Global_step')
     self._vocabs = set(extant_vocabs.values())
     return
 
+  #=============================================================
+  def count_vocabs(self, uncounted_vocabs):
+    """"""
+
+    # Multivocabs are counted through whichever of their vocabs didn't load
+    count_vocabs = []
+    for vocab in uncounted_vocabs:
+      if isinstance(vocab, vocabs.Multivocab):
+        count_vocabs.extend(subvocab for subvocab in vocab if not getattr(subvocab, '_loaded', False))
+      else:
+        count_vocabs.append(vocab)
+
+    # Read the training files once for every vocab that counts a column, then let the rest count themselves
+    column_vocabs = [vocab for vocab in count_vocabs if hasattr(vocab, 'add_counts')]
+    conllu_idxs = sorted(set(vocab.conllu_idx for vocab in column_vocabs))
+    if conllu_idxs:
+      column_counts = CoNLLUColumns.count_columns(self.train_conllus, conllu_idxs, n_workers=self.n_count_workers)
+      for vocab in column_vocabs:
+        vocab.add_counts(column_counts[vocab.conllu_idx])
+        vocab.index_by_counts()
+    for vocab in count_vocabs:
+      if not hasattr(vocab, 'add_counts') and hasattr(vocab, 'count'):
+        vocab.count(self.train_conllus)
+    return
+
   #=============================================================
   def train(self, load=False, noscreen=False):
     """"""
 
     trainset = conllu_dataset.CoNLLUTrainset(self.vocabs,
+                                             raw_columns=self.raw_columns,
                                              config=self._config)
     devset = conllu_dataset.CoNLLUDevset(self.vocabs,
+                                         raw_columns=self.raw_columns,
                                          config=self._config)
     testset = conllu_dataset.CoNLLUTestset(self.vocabs,
+                                           raw_columns=self.raw_columns,
                                            config=self._config)
 
     factored_deptree = None
@@ -222,19 +266,18 @@ class BaseNetwork(object):
               if steps_since_best >= 500 and self.switch_optimizers:
                 train_tensors = amsgrad_train_tensors
                 current_optimizer = 'AMSGrad'
-              for batch in trainset.batch_iterator(shuffle=True):
+              for batch, feed_dict in trainset.feed_iterator(shuffle=True):
                 train_outputs.restart_timer()
                 start_time = time.time()
-                feed_dict = trainset.set_placeholders(batch)
                 _, train_scores = sess.run(train_tensors, feed_dict=feed_dict)
-                train_outputs.update_history(train_scores)
+                train_outputs.update_history(train_scores, feed_times=trainset.pop_feed_times())
                 current_step += 1
                 if current_step % self.print_every == 0:
-                  for batch in devset.batch_iterator(shuffle=False):
+                  for batch, feed_dict in devset.feed_iterator(shuffle=False):
                     dev_outputs.restart_timer()
-                    feed_dict = devset.set_placeholders(batch)
                     dev_scores = sess.run(dev_tensors, feed_dict=feed_dict)
-                    dev_outputs.update_history(dev_scores)
+                    dev_outputs.update_history(dev_scores, feed_times=devset.pop_feed_times())
+                  dev_outputs.update_batch_stats(devset.batch_stats)
                   current_accuracy *= .5
                   current_accuracy += .5*dev_outputs.get_current_accuracy()
                   if current_accuracy >= best_accuracy:
@@ -270,6 +313,7 @@ class BaseNetwork(object):
                   stdscr.refresh()
               current_epoch = sess.run(self.global_step)
               sess.run(update_step)
+              train_outputs.update_batch_stats(trainset.batch_stats)
               trainset.load_next()
             with open(os.path.join(self.save_dir, 'SUCCESS'), 'w') as f:
               pass
@@ -312,10 +356,9 @@ class BaseNetwork(object):
               current_optimizer = 'AMSGrad'
               print('\t', end='')
               print('Current optimizer: {}\n'.format(current_optimizer), end='')
-            for batch in trainset.batch_iterator(shuffle=True):
+            for batch, feed_dict in trainset.feed_iterator(shuffle=True):
               train_outputs.restart_timer()
               start_time = time.time()
-              feed_dict = trainset.set_placeholders(batch)
               ##---
               #if current_step < 10:
               #  _, train_scores = sess.run(train_tensors, feed_dict=feed_dict, options=options, run_metadata=run_metadata)
@@ -327,14 +370,14 @@ class BaseNetwork(object):
               #  _, train_scores = sess.run(train_tensors, feed_dict=feed_dict)
               _, train_scores = sess.run(train_tensors, feed_dict=feed_dict)
               ##---
-              train_outputs.update_history(train_scores)
+              train_outputs.update_history(train_scores, feed_times=trainset.pop_feed_times())
               current_step += 1
               if current_step % self.print_every == 0:
-                for batch in devset.batch_iterator(shuffle=False):
+                for batch, feed_dict in devset.feed_iterator(shuffle=False):
                   dev_outputs.restart_timer()
-                  feed_dict = devset.set_placeholders(batch)
                   dev_scores = sess.run(dev_tensors, feed_dict=feed_dict)
-                  dev_outputs.update_history(dev_scores)
+                  dev_outputs.update_history(dev_scores, feed_times=devset.pop_feed_times())
+                dev_outputs.update_batch_stats(devset.batch_stats)
                 current_accuracy *= .5
                 current_accuracy += .5*dev_outputs.get_current_accuracy()
                 if current_accuracy >= best_accuracy:
@@ -361,6 +404,7 @@ class BaseNetwork(object):
                 dev_outputs.print_recent_history()
             current_epoch = sess.run(self.global_step)
             sess.run(update_step)
+            train_outputs.update_batch_stats(trainset.batch_stats)
             trainset.load_next()
           with open(os.path.join(self.save_dir, 'SUCCESS'), 'w') as f:
             pass
@@ -371,11 +415,13 @@ class BaseNetwork(object):
     return
 
   #=============================================================
-  def parse(self, conllu_files, output_dir=None, output_filename=None):
+  def parse(self, conllu_files, output_dir=None, output_filename=None, stream=False):
     """"""
 
-    parseset = conllu_dataset.CoNLLUDataset(conllu_files, self.vocabs,
-                                            config=self._config)
+    if not stream:
+      parseset = conllu_dataset.CoNLLUDataset(conllu_files, self.vocabs,
+                                              raw_columns=self.raw_columns,
+                                              config=self._config)
 
     if output_filename:
       assert len(conllu_files) == 1, "output_filename can only be specified for one input file"
@@ -386,6 +432,12 @@ class BaseNetwork(object):
         factored_deptree = vocab.factorized
       elif vocab.field == 'semrel':
         factored_semgraph = vocab.factorized
+    # Input stacks that only depend on the word type can be swapped for precomputed tables,
+    # and output vocabs can skip scores that decoding throws away
+    for vocab in self.input_vocabs:
+      vocab.set_inference()
+    for vocab in self.output_vocabs:
+      vocab.set_inference()
     with tf.variable_scope(self.classname, reuse=False):
       parse_graph = self.build_graph(reuse=True)
       parse_outputs = DevOutputs(*parse_graph, load=False, factored_deptree=factored_deptree, factored_semgraph=factored_semgraph, config=self._config)
@@ -398,10 +450,19 @@ class BaseNetwork(object):
     config = tf.ConfigProto()
     config.gpu_options.allow_growth = True
     config.allow_soft_placement = True
-    with tf.Session(config=config) as sess:
+    with self.open_decode_pool(parse_outputs), tf.Session(config=config) as sess:
       sess.run(tf.variables_initializer(list(non_save_variables)))
       saver.restore(sess, tf.train.latest_checkpoint(self.save_dir))
-      if len(conllu_files) == 1 or output_filename is not None:
+      for vocab in self.input_vocabs:
+        vocab.build_type_table(sess)
+      if stream:
+        for conllu_file in conllu_files:
+          # Same as below: a lone file goes to stdout, several go to save_dir/parsed
+          file_output_dir = output_dir
+          if output_dir is None and len(conllu_files) > 1:
+            file_output_dir = os.path.join(self.save_dir, 'parsed', os.path.dirname(conllu_file))
+          self.parse_stream(conllu_file, parse_outputs, sess, output_dir=file_output_dir, output_filename=output_filename)
+      elif len(conllu_files) == 1 or output_filename is not None:
         self.parse_file(parseset, parse_outputs, sess, output_dir=output_dir, output_filename=output_filename)
       else:
         self.parse_files(parseset, parse_outputs, sess, output_dir=output_dir)
@@ -411,16 +472,9 @@ class BaseNetwork(object):
   def parse_file(self, dataset, graph_outputs, sess, output_dir=None, output_filename=None, print_time=True):
     """"""
 
-    probability_tensors = graph_outputs.probabilities
     input_filename = dataset.conllu_files[0]
     graph_outputs.restart_timer()
-    for i, indices in enumerate(dataset.batch_iterator(shuffle=False)):
-      tokens, lengths = dataset.get_tokens(indices)
-      feed_dict = dataset.set_placeholders(indices)
-      probabilities = sess.run(probability_tensors, feed_dict=feed_dict)
-      predictions = graph_outputs.probs_to_preds(probabilities, lengths)
-      tokens.update({vocab.field: vocab[predictions[vocab.field]] for vocab in self.output_vocabs})
-      graph_outputs.cache_predictions(tokens, indices)
+    self.parse_batches(dataset, graph_outputs, sess)
 
     if output_dir is None and output_filename is None:
       graph_outputs.print_current_predictions()
@@ -438,22 +492,16 @@ class BaseNetwork(object):
         graph_outputs.dump_current_predictions(f)
     if print_time:
       print('\033[92mParsing 1 file took {:0.1f} seconds\033[0m'.format(time.time() - graph_outputs.time))
+      self.print_feed_times(dataset)
     return
 
   #=============================================================
   def parse_files(self, dataset, graph_outputs, sess, output_dir=None, print_time=True):
     """"""
 
-    probability_tensors = graph_outputs.probabilities
     graph_outputs.restart_timer()
     for input_filename in dataset.conllu_files:
-      for i, indices in enumerate(dataset.batch_iterator(shuffle=False)):
-        tokens, lengths = dataset.get_tokens(indices)
-        feed_dict = dataset.set_placeholders(indices)
-        probabilities = sess.run(probability_tensors, feed_dict=feed_dict)
-        predictions = graph_outputs.probs_to_preds(probabilities, lengths)
-        tokens.update({vocab.field: vocab[predictions[vocab.field]] for vocab in self.output_vocabs})
-        graph_outputs.cache_predictions(tokens, indices)
+      self.parse_batches(dataset, graph_outputs, sess)
 
       input_dir, input_filename = os.path.split(input_filename)
       if output_dir is None:
@@ -472,6 +520,115 @@ class BaseNetwork(object):
     if print_time:
       n_files = len(dataset.conllu_files)
       print('\033[92mParsing {} file{} took {:0.1f} seconds\033[0m'.format(n_files, 's' if n_files > 1 else '', time.time() - graph_outputs.time))
+      self.print_feed_times(dataset)
+    return
+
+  #=============================================================
+  def parse_stream(self, conllu_file, graph_outputs, sess, output_dir=None, output_filename=None, print_time=True):
+    """"""
+
+    # Only one chunk of sentences and its predictions are ever held in memory
+    dataset = conllu_dataset.CoNLLUStream(conllu_file, self.vocabs, raw_columns=self.raw_columns, config=self._config)
+    graph_outputs.restart_timer()
+    if output_dir is None and output_filename is None:
+      f = sys.stdout
+    else:
+      input_dir, input_filename = os.path.split(conllu_file)
+      if output_dir is None:
+        output_dir = os.path.join(self.save_dir, 'parsed', input_dir)
+      if output_filename is None:
+        assert conllu_file != '-', "output_filename must be specified when parsing from stdin"
+        output_filename = input_filename
+
+      if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+      f = codecs.open(os.path.join(output_dir, output_filename), 'w', encoding='utf-8')
+
+    n_sents = 0
+    try:
+      while True:
+        self.parse_batches(dataset, graph_outputs, sess)
+        graph_outputs.dump_current_predictions(f)
+        f.flush()
+        n_sents += dataset.n_sents
+        if dataset.exhausted:
+          break
+        dataset.load_next()
+    finally:
+      if f is not sys.stdout:
+        f.close()
+    if print_time:
+      print('\033[92mParsing {} sentences took {:0.1f} seconds\033[0m'.format(n_sents, time.time() - graph_outputs.time), file=sys.stderr)
+      self.print_feed_times(dataset, file=sys.stderr)
+    return
+
+  #=============================================================
+  @staticmethod
+  def print_feed_times(dataset, file=sys.stdout):
+    """"""
+
+    feed_time, wait_time = dataset.pop_feed_times()
+    hidden_time = max(feed_time - wait_time, 0)
+    print('\033[92mBuilding batches took {:0.1f} seconds, {:0.1f} of which ran alongside the session\033[0m'.format(feed_time, hidden_time), file=file)
+    return
+
+  #=============================================================
+  @contextmanager
+  def open_decode_pool(self, graph_outputs):
+    """"""
+
+    # Workers are forked before the session starts so they don't inherit its
+    # threads, and they inherit graph_outputs instead of pickling it
+    global _decode_outputs
+    if self.n_decode_workers <= 1:
+      yield
+      return
+    _decode_outputs = graph_outputs
+    try:
+      with multiprocessing.get_context('fork').Pool(self.n_decode_workers) as pool:
+        self._decode_pool = pool
+        yield
+    finally:
+      self._decode_pool = None
+      _decode_outputs = None
+
+  #=============================================================
+  def parse_batches(self, dataset, graph_outputs, sess):
+    """"""
+
+    fetches = graph_outputs.parse_fetches
+    # (tokens, indices, async predictions), oldest first
+    pending = deque()
+    for indices, feed_dict in dataset.feed_iterator(shuffle=False):
+      tokens, lengths = dataset.get_tokens(indices)
+      segments = dataset.get_segments(indices)
+      if graph_outputs.selects_heads:
+        # The trees have to be decoded between the two halves of the run
+        predictions = graph_outputs.run_selected_heads(sess, feed_dict, lengths, segments=segments)
+        self.cache_predictions(graph_outputs, tokens, indices, predictions)
+        continue
+      fetched = sess.run(fetches, feed_dict=feed_dict)
+      if self._decode_pool is None:
+        predictions = graph_outputs.fetches_to_preds(fetched, lengths, segments=segments)
+        self.cache_predictions(graph_outputs, tokens, indices, predictions)
+      else:
+        # The workers decode this batch while the session runs the next ones;
+        # batches are cached in order, and at most two per worker wait around
+        pending.append((tokens, indices, self._decode_pool.apply_async(_fetches_to_preds, ((fetched, lengths, segments),))))
+        while pending and (pending[0][2].ready() or len(pending) > 2*self.n_decode_workers):
+          tokens, indices, predictions = pending.popleft()
+          self.cache_predictions(graph_outputs, tokens, indices, predictions.get())
+    while pending:
+      tokens, indices, predictions = pending.popleft()
+      self.cache_predictions(graph_outputs, tokens, indices, predictions.get())
+    return
+
+  #=============================================================
+  def cache_predictions(self, graph_outputs, tokens, indices, predictions):
+    """"""
+
+    tokens.update({vocab.field: vocab.decode_batch(predictions[vocab.field]) for vocab in self.output_vocabs})
+    graph_outputs.cache_predictions(tokens, indices)
     return
 
   #=============================================================
@@ -494,6 +651,12 @@ class BaseNetwork(object):
   def train_conllus(self):
     return self._config.getfiles(self, 'train_conllus')
   @property
+  def n_count_workers(self):
+    return self._config.getint(self, 'n_count_workers')
+  @property
+  def n_decode_workers(self):
+    return self._config.getint(self, 'n_decode_workers')
+  @property
   def cuda_visible_devices(self):
     return os.getenv('CUDA_VISIBLE_DEVICES')
   @property
@@ -512,6 +675,12 @@ class BaseNetwork(object):
   def throughput_vocabs(self):
     return self._throughput_vocabs
   @property
+  def raw_columns(self):
+    return self._raw_columns
+  @property
+  def raw_throughput(self):
+    return self._config.getboolean(self, 'raw_throughput')
+  @property
   def output_vocabs(self):
     return self._output_vocabs
   @property
@@ -604,6 +773,9 @@ class BaseNetwork(object):
   def bilin(self):
     return self._config.getboolean(self, 'bilin')
   @property
+  def pack_sentences(self):
+    return self._config.getboolean(self, 'pack_sentences')
+  @property
   def switch_optimizers(self):
     return self._config.getboolean(self, 'switch_optimizers')
   @property
@@ -636,3 +808,11 @@ class BaseNetwork(object):
   @property
   def share_layer(self):
     return self._config.getboolean(self, 'share_layer')
+
+#***************************************************************
+# Set by BaseNetwork.open_decode_pool right before the worker processes are forked
+_decode_outputs = None
+
+def _fetches_to_preds(args):
+  fetched, lengths, segments = args
+  return _decode_outputs.fetches_to_preds(fetched, lengths, segments=segments)
@@ -42,6 +42,7 @@ class ElmoNetwork(BaseNetwork):
   def build_graph(self, input_network_outputs={}, reuse=True):
     """"""
     
+    assert not self.pack_sentences, '{} does not support pack_sentences'.format(self.classname)
     outputs = {}
     with tf.variable_scope('Embeddings'):
       input_tensors = [input_vocab.get_input_tensor(reuse=reuse) for input_vocab in self.input_vocabs]
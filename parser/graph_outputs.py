@@ -33,7 +33,8 @@ import numpy as np
 import tensorflow as tf
 
 from parser.neural import nn
-from scripts.chuliu_edmonds import chuliu_edmonds_one_root
+from scripts.chuliu_edmonds import chuliu_edmonds_one_root, mst_one_root
+from scripts.eisner import eisner
 
 #***************************************************************
 class GraphOutputs(object):
@@ -53,6 +54,9 @@ class GraphOutputs(object):
                     ('semrel', 'OLS'),
                     ('semgraph', 'LF1')]
   
+  _tree_decoders = {'chuliu_edmonds': chuliu_edmonds_one_root,
+                    'mst': mst_one_root}
+  
   #=============================================================
   def __init__(self, outputs, tokens, load=False, evals=None, factored_deptree=None, factored_semgraph=None, config=None):
     """"""
@@ -72,10 +76,25 @@ class GraphOutputs(object):
     self.time = None
     
     #-----------------------------------------------------------
+    self._head_probabilities = None
+    self._heads_placeholder = None
+    self._selected_label_predictions = None
     for field in outputs:
       self._probabilities[field] = outputs[field].pop('probabilities')
+      if field == 'deptree' and 'heads_placeholder' in outputs[field]:
+        self._head_probabilities = outputs[field].pop('head_probabilities')
+        self._heads_placeholder = outputs[field].pop('heads_placeholder')
+        self._selected_label_predictions = outputs[field].pop('selected_label_predictions')
+        if self.compact_fetches:
+          self._head_probabilities = tf.cast(self._head_probabilities, self.compact_dtype)
       self._accuracies[field] = outputs[field]
     
+    # Predictions made inside the graph, so that parsing doesn't fetch whole distributions
+    self._compact_fetches = {}
+    if self.compact_fetches:
+      for field, probs in six.iteritems(self._probabilities):
+        self._compact_fetches[field] = self.get_compact_fetch(field, probs)
+    
     #-----------------------------------------------------------
     filename = os.path.join(self.save_dir, '{}.pkl'.format(self.dataset))
     # TODO make a separate History object
@@ -87,7 +106,9 @@ class GraphOutputs(object):
         'total': {'n_batches' : 0,
                   'n_tokens': 0,
                   'n_sequences': 0,
-                  'total_time': 0},
+                  'total_time': 0,
+                  'feed_time': 0,
+                  'wait_time': 0},
         'speed': {'toks/sec': [],
                   'seqs/sec': [],
                   'bats/sec': []}
@@ -133,10 +154,77 @@ class GraphOutputs(object):
     return
   
   #=============================================================
-  def probs_to_preds(self, probabilities, lengths):
+  def get_compact_fetch(self, field, probs):
+    """"""
+    
+    if field == 'form':
+      # The sampled vocabulary is only argmaxed after fetching
+      return probs
+    if isinstance(probs, (tuple, list)):
+      return [self.get_compact_fetch(field, prob_mat) for prob_mat in probs]
+    if field == 'deptree':
+      # (n x m x m x c) -> (n x m x m) head probabilities for the tree decoder,
+      # and the best label for every possible head
+      if self._factored_deptree:
+        head_probs = tf.reduce_sum(probs, axis=-1)
+      else:
+        head_probs = tf.reduce_max(probs, axis=-1)
+      label_preds = tf.argmax(probs, axis=-1, output_type=tf.int32)
+      return [tf.cast(head_probs, self.compact_dtype), label_preds]
+    if field == 'semgraph':
+      # (n x m x m x c) -> (n x m x m)
+      label_preds = tf.argmax(probs, axis=-1, output_type=tf.int32)
+      if self._factored_semgraph:
+        head_preds = tf.to_int32(tf.greater_equal(tf.reduce_sum(probs, axis=-1), .5))
+        return head_preds * label_preds
+      return label_preds
+    # (n x m x c) -> (n x m)
+    return tf.argmax(probs, axis=-1, output_type=tf.int32)
+  
+  #=============================================================
+  @staticmethod
+  def unpack_probabilities(probabilities, segments):
+    """"""
+    
+    # Split packed rows back into one (padded) row per sentence
+    rows, offsets, lengths = segments
+    n_sents, max_length = len(lengths), np.max(lengths)
+    sent_indices = np.repeat(np.arange(n_sents), lengths)
+    positions = np.arange(np.sum(lengths)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    packed_rows = np.repeat(rows, lengths)
+    packed_positions = np.repeat(offsets, lengths) + positions
+    
+    def unpack(probs, pairwise=False):
+      if isinstance(probs, (tuple, list)):
+        return type(probs)(unpack(prob_mat, pairwise=pairwise) for prob_mat in probs)
+      if pairwise:
+        # (r x m' x m' x ...) -> (n x m x m x ...)
+        unpacked_probs = np.zeros((n_sents, max_length, max_length) + probs.shape[3:], dtype=probs.dtype)
+        for i, (row, offset, length) in enumerate(zip(rows, offsets, lengths)):
+          unpacked_probs[i, :length, :length] = probs[row, offset:offset+length, offset:offset+length]
+      else:
+        # (r x m' x ...) -> (n x m x ...)
+        unpacked_probs = np.zeros((n_sents, max_length) + probs.shape[2:], dtype=probs.dtype)
+        unpacked_probs[sent_indices, positions] = probs[packed_rows, packed_positions]
+      return unpacked_probs
+    
+    unpacked = {}
+    for field, probs in six.iteritems(probabilities):
+      if field == 'form' and isinstance(probs, (tuple, list)):
+        # The sampled vocabulary isn't laid out by position
+        form_samples, form_probs = probs
+        unpacked[field] = (form_samples, unpack(form_probs))
+      else:
+        unpacked[field] = unpack(probs, pairwise=field in ('deptree', 'semgraph'))
+    return unpacked
+  
+  #=============================================================
+  def probs_to_preds(self, probabilities, lengths, segments=None):
     """"""
     
     predictions = {}
+    if segments is not None:
+      probabilities = self.unpack_probabilities(probabilities, segments)
     
     if 'form' in probabilities:
       form_probs = probabilities['form']
@@ -178,12 +266,7 @@ class GraphOutputs(object):
         dephead_probs = deptree_probs.sum(axis=-1)
         # (n x m x m) -> (n x m)
         #dephead_preds = np.argmax(dephead_probs, axis=-1)
-        dephead_preds = np.zeros(dephead_probs.shape[:2], dtype=np.int32)
-        for i, (_dephead_probs, length) in enumerate(zip(dephead_probs, lengths)):
-          #print(_dephead_probs)
-          #input()
-          cle = chuliu_edmonds_one_root(_dephead_probs[:length, :length])
-          dephead_preds[i, :length] = cle
+        dephead_preds = self.decode_trees(dephead_probs, lengths)
         # ()
         bucket_size = dephead_preds.shape[1]
         # (n x m) -> (n x m x m)
@@ -200,7 +283,7 @@ class GraphOutputs(object):
         # (n x m x mc) -> (n x m)
         deptree_preds = np.argmax(deptree_probs, axis=-1)
         # (n x m) -> (n x m)
-        dephead_preds = deptree_preds // bucket_size
+        dephead_preds = deptree_preds // n_classes
         deprel_preds = deptree_preds % n_classes
       predictions['dephead'] = dephead_preds
       predictions['deprel'] = deprel_preds
@@ -219,17 +302,116 @@ class GraphOutputs(object):
       else:
         # (n x m x m x c) -> (n x m x m)
         semgraph_preds = np.argmax(semgraph_probs, axis=-1)
-      predictions['semrel'] = sparse_semgraph_preds = []
+      predictions['semrel'] = self.sparsify_semgraph(semgraph_preds)
+      predictions['semhead'] = []
+    return predictions
+  
+  #=============================================================
+  def compact_to_preds(self, compact, lengths, segments=None):
+    """"""
+    
+    # Only the trees are left to decode; everything else was decided in the graph
+    predictions = {}
+    if segments is not None:
+      compact = self.unpack_probabilities(compact, segments)
+    
+    if 'form' in compact:
+      predictions.update(self.probs_to_preds({'form': compact['form']}, lengths))
+    for field in ('lemma', 'upos', 'xpos', 'ufeats'):
+      if field in compact:
+        preds = compact[field]
+        if isinstance(preds, (tuple, list)):
+          preds = np.stack(preds, axis=-1)
+        predictions[field] = preds
+    if 'deptree' in compact:
+      # (n x m x m), (n x m x m)
+      dephead_probs, deprel_preds = compact['deptree']
+      if self._factored_deptree:
+        dephead_preds = self.decode_trees(dephead_probs, lengths)
+      else:
+        dephead_preds = np.argmax(dephead_probs, axis=-1)
+      predictions['dephead'] = dephead_preds
+      predictions['deprel'] = np.take_along_axis(deprel_preds, dephead_preds[...,None], axis=-1)[...,0]
+    if 'semgraph' in compact:
+      predictions['semrel'] = self.sparsify_semgraph(compact['semgraph'])
       predictions['semhead'] = []
-      for i in range(len(semgraph_preds)):
-        sparse_semgraph_preds.append([])
-        for j in range(len(semgraph_preds[i])):
-          sparse_semgraph_preds[-1].append([])
-          for k, pred in enumerate(semgraph_preds[i,j]):
-            if pred:
-              sparse_semgraph_preds[-1][-1].append((k, semgraph_preds[i,j,k]))
     return predictions
   
+  #=============================================================
+  def run_selected_heads(self, sess, feed_dict, lengths, segments=None):
+    """"""
+    
+    # Decode the trees from the head probabilities, then feed them back into
+    # the same run to score labels only for those heads
+    fetches = self.parse_fetches
+    fetches['deptree'] = self._head_probabilities
+    handle = sess.partial_run_setup([fetches, self._selected_label_predictions],
+                                    list(feed_dict.keys()) + [self._heads_placeholder])
+    fetched = sess.partial_run(handle, fetches, feed_dict=feed_dict)
+    # (n x m x m), or (r x m' x m') when sentences are packed
+    dephead_probs = fetched.pop('deptree')
+    packed_shape = dephead_probs.shape[:2]
+    predictions = self.fetches_to_preds(fetched, lengths, segments=segments)
+    if segments is not None:
+      dephead_probs = self.unpack_probabilities({'deptree': dephead_probs}, segments)['deptree']
+    # (n x m)
+    dephead_preds = self.decode_trees(dephead_probs, lengths)
+    
+    if segments is None:
+      heads = dephead_preds
+    else:
+      # Point at the heads' positions in the packed rows
+      rows, offsets, segment_lengths = segments
+      heads = np.zeros(packed_shape, dtype=np.int32)
+      for i, (row, offset, length) in enumerate(zip(rows, offsets, segment_lengths)):
+        heads[row, offset:offset+length] = offset + dephead_preds[i, :length]
+    deprel_preds = sess.partial_run(handle, self._selected_label_predictions, feed_dict={self._heads_placeholder: heads})
+    if segments is not None:
+      deprel_preds = self.unpack_probabilities({'deprel': deprel_preds}, segments)['deprel']
+    predictions['dephead'] = dephead_preds
+    predictions['deprel'] = deprel_preds
+    return predictions
+  
+  #=============================================================
+  def fetches_to_preds(self, fetches, lengths, segments=None):
+    """"""
+    
+    if self.compact_fetches:
+      return self.compact_to_preds(fetches, lengths, segments=segments)
+    return self.probs_to_preds(fetches, lengths, segments=segments)
+  
+  #=============================================================
+  def decode_trees(self, dephead_probs, lengths):
+    """"""
+    
+    if self.tree_decoder == 'eisner':
+      # Projective trees, decoded for the whole bucket at once
+      return eisner(dephead_probs, lengths)
+    dephead_preds = np.zeros(dephead_probs.shape[:2], dtype=np.int32)
+    tree_decoder = self._tree_decoders[self.tree_decoder]
+    for i, (_dephead_probs, length) in enumerate(zip(dephead_probs, lengths)):
+      #print(_dephead_probs)
+      #input()
+      cle = tree_decoder(_dephead_probs[:length, :length])
+      dephead_preds[i, :length] = cle
+    return dephead_preds
+  
+  #=============================================================
+  @staticmethod
+  def sparsify_semgraph(semgraph_preds):
+    """"""
+    
+    # (n x m x m) -> n lists of m lists of (head, label) pairs
+    sparse_semgraph_preds = []
+    for i in range(len(semgraph_preds)):
+      sparse_semgraph_preds.append([])
+      for j in range(len(semgraph_preds[i])):
+        sparse_semgraph_preds[-1].append([])
+        for k, pred in enumerate(semgraph_preds[i,j]):
+          if pred:
+            sparse_semgraph_preds[-1][-1].append((k, semgraph_preds[i,j,k]))
+    return sparse_semgraph_preds
+  
   #=============================================================
   def cache_predictions(self, tokens, indices):
     """"""
@@ -339,11 +521,17 @@ class GraphOutputs(object):
     return
   
   #=============================================================
-  def update_history(self, outputs):
+  def update_history(self, outputs, feed_times=None):
     """"""
     
     self.history['total']['total_time'] += time.time() - self.time
     self.time = None
+    if feed_times is not None:
+      feed_time, wait_time = feed_times
+      # Time spent waiting on the next batch happened before the timer was restarted
+      self.history['total']['total_time'] += wait_time
+      self.history['total']['feed_time'] = self.history['total'].get('feed_time', 0) + feed_time
+      self.history['total']['wait_time'] = self.history['total'].get('wait_time', 0) + wait_time
     self.history['total']['n_batches'] += 1
     self.history['total']['n_tokens'] += outputs['total']['n_tokens']
     self.history['total']['n_sequences'] += outputs['total']['n_sequences']
@@ -381,6 +569,14 @@ class GraphOutputs(object):
         self.history[field]['sequences'][-1] += output['n_correct_sequences']
     return
   
+  #=============================================================
+  def update_batch_stats(self, batch_stats):
+    """"""
+    
+    if batch_stats is not None:
+      self.history.setdefault('batches', []).append(batch_stats)
+    return
+  
   #=============================================================
   def print_recent_history(self, stdscr=None):
     """"""
@@ -389,10 +585,14 @@ class GraphOutputs(object):
     n_tokens = self.history['total']['n_tokens']
     n_sequences = self.history['total']['n_sequences']
     total_time = self.history['total']['total_time']
+    feed_time = self.history['total'].get('feed_time', 0)
+    wait_time = self.history['total'].get('wait_time', 0)
     self.history['total']['n_batches'] = 0
     self.history['total']['n_tokens'] = 0
     self.history['total']['n_sequences'] = 0
     self.history['total']['total_time'] = 0
+    self.history['total']['feed_time'] = 0
+    self.history['total']['wait_time'] = 0
     
     #-----------------------------------------------------------
     if stdscr is not None:
@@ -447,6 +647,10 @@ class GraphOutputs(object):
     tps = self.history['speed']['toks/sec'][-1]
     sps = self.history['speed']['seqs/sec'][-1]
     bps = self.history['speed']['bats/sec'][-1]
+    # How much of the time spent building feed_dicts overlapped with the session
+    hidden = 100 * max(feed_time - wait_time, 0) / feed_time if feed_time else 0
+    # Padding and cost of the most recent full pass over the data
+    batch_stats = self.history['batches'][-1] if self.history.get('batches') else None
     if stdscr is not None:
       stdscr.clrtoeol()
       stdscr.addstr('Speed', curses.color_pair(6) | curses.A_BOLD)
@@ -460,6 +664,22 @@ class GraphOutputs(object):
       stdscr.addstr('Toks: {:6d}'.format(n_tokens), curses.color_pair(7) | curses.A_BOLD)
       stdscr.addstr(' | ')
       stdscr.addstr('Seqs: {:5d}\n'.format(n_sequences), curses.color_pair(7) | curses.A_BOLD)
+      if feed_time:
+        stdscr.clrtoeol()
+        stdscr.addstr('Feed ', curses.color_pair(6) | curses.A_BOLD)
+        stdscr.addstr(' | ')
+        stdscr.addstr('Secs: {:6.2f}'.format(feed_time), curses.color_pair(5) | curses.A_BOLD)
+        stdscr.addstr(' | ')
+        stdscr.addstr('Hidden: {:5.1f}%\n'.format(hidden), curses.color_pair(5) | curses.A_BOLD)
+      if batch_stats:
+        stdscr.clrtoeol()
+        stdscr.addstr('Batch', curses.color_pair(6) | curses.A_BOLD)
+        stdscr.addstr(' | ')
+        stdscr.addstr('Count: {:5d}'.format(batch_stats['n_batches']), curses.color_pair(7) | curses.A_BOLD)
+        stdscr.addstr(' | ')
+        stdscr.addstr('Padding: {:5.1f}%'.format(100*batch_stats['padding']), curses.color_pair(7) | curses.A_BOLD)
+        stdscr.addstr(' | ')
+        stdscr.addstr('Max cost: {:d} ({:d} squared)\n'.format(batch_stats['max_cost'], batch_stats['max_cost_squared']), curses.color_pair(7) | curses.A_BOLD)
     else:
       print('Speed', end='')
       print(' | ', end='')
@@ -471,6 +691,20 @@ class GraphOutputs(object):
       print('Toks: {:6d}'.format(n_tokens), end='')
       print(' | ', end='')
       print('Seqs: {:5d}\n'.format(n_sequences), end='')
+      if feed_time:
+        print('Feed ', end='')
+        print(' | ', end='')
+        print('Secs: {:6.2f}'.format(feed_time), end='')
+        print(' | ', end='')
+        print('Hidden: {:5.1f}%\n'.format(hidden), end='')
+      if batch_stats:
+        print('Batch', end='')
+        print(' | ', end='')
+        print('Count: {:5d}'.format(batch_stats['n_batches']), end='')
+        print(' | ', end='')
+        print('Padding: {:5.1f}%'.format(100*batch_stats['padding']), end='')
+        print(' | ', end='')
+        print('Max cost: {:d} ({:d} squared)\n'.format(batch_stats['max_cost'], batch_stats['max_cost_squared']), end='')
     filename = os.path.join(self.save_dir, '{}.pkl'.format(self.dataset))
     with open(filename, 'wb') as f:
       pkl.dump(self.history, f, protocol=pkl.HIGHEST_PROTOCOL)
@@ -487,12 +721,27 @@ class GraphOutputs(object):
   def probabilities(self):
     return dict(self._probabilities)
   @property
+  def parse_fetches(self):
+    return dict(self._compact_fetches) if self.compact_fetches else self.probabilities
+  @property
   def loss(self):
     return self._loss
   @property
   def save_dir(self):
     return self._config.getstr(self, 'save_dir')
   @property
+  def tree_decoder(self):
+    return self._config.getstr(self, 'tree_decoder')
+  @property
+  def selects_heads(self):
+    return self._heads_placeholder is not None
+  @property
+  def compact_fetches(self):
+    return self._config.getboolean(self, 'compact_fetches')
+  @property
+  def compact_dtype(self):
+    return tf.float16 if self._config.getboolean(self, 'compact_float16') else tf.float32
+  @property
   def dataset(self):
     return self._dataset
 
@@ -40,6 +40,7 @@ class GraphParserNetwork(BaseNetwork):
   def build_graph(self, input_network_outputs={}, reuse=True):
     """"""
     
+    assert not self.pack_sentences, '{} does not support pack_sentences'.format(self.classname)
     with tf.variable_scope('Embeddings'):
       if self.sum_pos: # TODO this should be done with a `POSMultivocab`
         pos_vocabs = list(filter(lambda x: 'POS' in x.classname, self.input_vocabs))
@@ -202,7 +202,7 @@ def batch_bilinear_classifier(layer1, layer2, output_size, hidden_keep_prob, add
   return layer
 
 #===============================================================
-def bilinear_classifier(layer1, layer2, output_size, hidden_keep_prob=1., add_linear=True):
+def bilinear_classifier(layer1, layer2, output_size, hidden_keep_prob=1., add_linear=True, attention_mask=None):
   """"""
   
   layer_shape = nn.get_sizes(layer1)
@@ -242,10 +242,13 @@ def bilinear_classifier(layer1, layer2, output_size, hidden_keep_prob=1., add_li
   layer = tf.matmul(layer, layer2, transpose_b=True)
   # (n x mo x m) -> (n x m x o x m)
   layer = nn.reshape(layer, layer_shape + [output_size, bucket_size]) + biases
+  if attention_mask is not None:
+    # (n x m x o x m) o (n x m x 1 x m) -> (n x m x o x m)
+    layer = nn.mask_logits(layer, tf.expand_dims(attention_mask, -2))
   return layer
 
 #===============================================================
-def diagonal_bilinear_classifier(layer1, layer2, output_size, hidden_keep_prob=1., add_linear=True):
+def diagonal_bilinear_classifier(layer1, layer2, output_size, hidden_keep_prob=1., add_linear=True, attention_mask=None):
   """"""
   
   layer_shape = nn.get_sizes(layer1)
@@ -311,6 +314,97 @@ def diagonal_bilinear_classifier(layer1, layer2, output_size, hidden_keep_prob=1
     layer += lin_layer1 + lin_layer2
   # (n x m x o x m) + (o x 1) -> (n x m x o x m)
   layer += biases
+  if attention_mask is not None:
+    # (n x m x o x m) o (n x m x 1 x m) -> (n x m x o x m)
+    layer = nn.mask_logits(layer, tf.expand_dims(attention_mask, -2))
+  return layer
+
+#===============================================================
+def gather_heads(layer, heads):
+  """"""
+  
+  # (n x m x d), (n x m) -> (n x m x d) the head of every token
+  layer_shape = nn.get_sizes(layer)
+  batch_indices = tf.tile(tf.expand_dims(tf.range(layer_shape[0]), 1), tf.stack([1, layer_shape[1]]))
+  return tf.gather_nd(layer, tf.stack([batch_indices, heads], axis=-1))
+
+#===============================================================
+def bilinear_classifier_cond(layer1, layer2, output_size, heads, hidden_keep_prob=1., add_linear=True):
+  """"""
+  
+  # bilinear_classifier's scores for one head per token: (n x m x o) instead of (n x m x o x m)
+  layer_shape = nn.get_sizes(layer1)
+  input1_size = layer_shape.pop()+add_linear
+  input2_size = layer2.get_shape().as_list()[-1]+add_linear
+  ones_shape = tf.stack(layer_shape + [1])
+  
+  weights = tf.get_variable('Weights', shape=[input1_size, output_size, input2_size], initializer=tf.zeros_initializer)
+  if hidden_keep_prob < 1.:
+    noise_shape1 = tf.stack(layer_shape[:-1] + [1, input1_size-add_linear])
+    noise_shape2 = tf.stack(layer_shape[:-1] + [1, input2_size-add_linear])
+    layer1 = nn.dropout(layer1, hidden_keep_prob, noise_shape=noise_shape1)
+    layer2 = nn.dropout(layer2, hidden_keep_prob, noise_shape=noise_shape2)
+  if add_linear:
+    ones = tf.ones(ones_shape)
+    layer1 = tf.concat([layer1, ones], -1)
+    layer2 = tf.concat([layer2, ones], -1)
+    biases = 0
+  else:
+    biases = tf.get_variable('Biases', shape=[output_size], initializer=tf.zeros_initializer)
+  
+  # (n x m x d) -> (n x m x d)
+  layer2 = gather_heads(layer2, heads)
+  # (n x m x d) -> (nm x d)
+  layer1 = nn.reshape(layer1, [-1, input1_size])
+  # (n x m x d) -> (nm x d x 1)
+  layer2 = nn.reshape(layer2, [-1, input2_size, 1])
+  # (d x o x d) -> (d x od)
+  weights = nn.reshape(weights, [input1_size, output_size*input2_size])
+  
+  # (nm x d) * (d x od) -> (nm x od)
+  layer = tf.matmul(layer1, weights)
+  # (nm x od) -> (nm x o x d)
+  layer = nn.reshape(layer, [-1, output_size, input2_size])
+  # (nm x o x d) * (nm x d x 1) -> (nm x o x 1)
+  layer = tf.matmul(layer, layer2)
+  # (nm x o x 1) -> (n x m x o)
+  layer = nn.reshape(layer, layer_shape + [output_size]) + biases
+  return layer
+
+#===============================================================
+def diagonal_bilinear_classifier_cond(layer1, layer2, output_size, heads, hidden_keep_prob=1., add_linear=True):
+  """"""
+  
+  # diagonal_bilinear_classifier's scores for one head per token: (n x m x o) instead of (n x m x o x m)
+  layer_shape = nn.get_sizes(layer1)
+  input1_size = layer_shape.pop()
+  input2_size = layer2.get_shape().as_list()[-1]
+  assert input1_size == input2_size, "Inputs to diagonal_bilinear_classifier_cond don't match"
+  input_size = input1_size
+  
+  weights = tf.get_variable('Weights', shape=[input_size, output_size], initializer=tf.zeros_initializer)
+  if add_linear:
+    weights1 = tf.get_variable('Weights1', shape=[input_size, output_size], initializer=tf.zeros_initializer)
+  biases = tf.get_variable('Biases', shape=[output_size], initializer=tf.zeros_initializer)
+  if hidden_keep_prob < 1.:
+    noise_shape = tf.stack(layer_shape[:-1] + [1, input_size])
+    layer1 = nn.dropout(layer1, hidden_keep_prob, noise_shape=noise_shape)
+    layer2 = nn.dropout(layer2, hidden_keep_prob, noise_shape=noise_shape)
+  
+  # (n x m x d) -> (n x m x d)
+  layer2 = gather_heads(layer2, heads)
+  # (n x m x d) -> (nm x d)
+  layer1 = nn.reshape(layer1, [-1, input_size])
+  layer2 = nn.reshape(layer2, [-1, input_size])
+  
+  # (nm x d) (*) (nm x d) -> (nm x d) * (d x o) -> (nm x o)
+  layer = tf.matmul(layer1 * layer2, weights)
+  if add_linear:
+    # The head side uses Weights1 too, the same as in diagonal_bilinear_classifier
+    # (nm x d) * (d x o) -> (nm x o)
+    layer += tf.matmul(layer1, weights1) + tf.matmul(layer2, weights1)
+  # (nm x o) -> (n x m x o)
+  layer = nn.reshape(layer, layer_shape + [output_size]) + biases
   return layer
 
 #===============================================================
@@ -415,7 +509,7 @@ def diagonal_bilinear_discriminator(layer1, layer2, hidden_keep_prob=1., add_lin
   return layer
 
 #===============================================================
-def bilinear_attention(layer1, layer2, hidden_keep_prob=1., add_linear=True):
+def bilinear_attention(layer1, layer2, hidden_keep_prob=1., add_linear=True, attention_mask=None):
   """"""
   
   layer_shape = nn.get_sizes(layer1)
@@ -449,6 +543,9 @@ def bilinear_attention(layer1, layer2, hidden_keep_prob=1., add_linear=True):
   attn = tf.matmul(attn, layer2, transpose_b=True)
   # (n x m x m) -> (n x m x m)
   attn = nn.reshape(attn, layer_shape + [bucket_size])
+  if attention_mask is not None:
+    # (n x m x m) o (n x m x m) -> (n x m x m)
+    attn = nn.mask_logits(attn, attention_mask)
   # (n x m x m) -> (n x m x m)
   soft_attn = tf.nn.softmax(attn)
   # (n x m x m) * (n x m x d) -> (n x m x d)
@@ -457,7 +554,7 @@ def bilinear_attention(layer1, layer2, hidden_keep_prob=1., add_linear=True):
   return attn, weighted_layer1
   
 #===============================================================
-def diagonal_bilinear_attention(layer1, layer2, hidden_keep_prob=1., add_linear=True):
+def diagonal_bilinear_attention(layer1, layer2, hidden_keep_prob=1., add_linear=True, attention_mask=None):
   """"""
   
   layer_shape = nn.get_sizes(layer1)
@@ -507,6 +604,9 @@ def diagonal_bilinear_attention(layer1, layer2, hidden_keep_prob=1., add_linear=
   if add_linear:
     # (n x m x m) + (n x 1 x m) -> (n x m x m)
     attn += lin_attn2
+  if attention_mask is not None:
+    # (n x m x m) o (n x m x m) -> (n x m x m)
+    attn = nn.mask_logits(attn, attention_mask)
   # (n x m x m) -> (n x m x m)
   soft_attn = tf.nn.softmax(attn)
   # (n x m x m) * (n x m x d) -> (n x m x d)
@@ -107,10 +107,13 @@ def token_embedding_lookup(n_entries, embed_size, ids, nonzero_init=False, reuse
   return layers
 
 #===============================================================
-def pretrained_embedding_lookup(params, linear_size, ids, name='', reuse=True):
+def pretrained_embedding_lookup(params, linear_size, ids, name='', scales=None, reuse=True):
   """"""
 
   layer = tf.nn.embedding_lookup(params, ids)
+  if scales is not None:
+    # Quantized rows are dequantized after the lookup, so only the gathered rows are ever float
+    layer = tf.to_float(layer) * tf.nn.embedding_lookup(scales, ids)
   batch_size, bucket_size, input_size = nn.get_sizes(layer)
   shape = [input_size, linear_size]
   weights = tf.get_variable(name+'Transformation', shape=shape)#, initializer=tf.orthogonal_initializer)
@@ -156,3 +156,32 @@ def tile(inputs, multiples):
   if isinstance(multiples, (tuple, list)):
     multiples = tf.stack(multiples)
   return tf.tile(inputs, multiples)
+
+#===============================================================
+def segment_ids(ids):
+  """"""
+  
+  # Packed rows hold several sentences back to back, each a root (id 0) followed
+  # by its tokens (ids 1..k), with any padding (id 0) at the very end
+  # (n x m) -> (n x m)
+  next_ids = tf.pad(ids[:,1:], [[0,0], [0,1]])
+  starts = tf.logical_and(tf.equal(ids, 0), tf.equal(next_ids, 1))
+  non_pads = tf.logical_or(tf.greater(ids, 0), starts)
+  # (n x m) -> (n x m); 1..s for each sentence, 0 for padding
+  return tf.cumsum(tf.to_int32(starts), axis=1) * tf.to_int32(non_pads)
+
+#===============================================================
+def segment_mask(segment_ids):
+  """"""
+  
+  # (n x m) -> (n x m x 1), (n x 1 x m)
+  dep_segment_ids = tf.expand_dims(segment_ids, -1)
+  head_segment_ids = tf.expand_dims(segment_ids, -2)
+  # (n x m x 1), (n x 1 x m) -> (n x m x m); block diagonal, without the padding
+  return tf.logical_and(tf.equal(dep_segment_ids, head_segment_ids), tf.greater(head_segment_ids, 0))
+
+#===============================================================
+def mask_logits(logits, mask):
+  """"""
+  
+  return logits - 1e9 * (1 - tf.to_float(mask))
@@ -107,7 +107,7 @@ def RNN(layer, recur_size, conv_width=0, recur_func=nonlin.relu, conv_keep_prob=
   return layer, layer
 
 #===============================================================
-def LSTM(layer, recur_size, seq_lengths, conv_width=0, recur_func=nonlin.tanh, conv_keep_prob=1., recur_keep_prob=1., recur_include_prob=1., cifg=False, highway=False, highway_func=tf.identity):
+def LSTM(layer, recur_size, seq_lengths, conv_width=0, recur_func=nonlin.tanh, conv_keep_prob=1., recur_keep_prob=1., recur_include_prob=1., cifg=False, highway=False, highway_func=tf.identity, segment_ids=None):
   """"""
 
   #max_length = tf.reduce_max(seq_lengths)
@@ -162,6 +162,12 @@ def LSTM(layer, recur_size, seq_lengths, conv_width=0, recur_func=nonlin.tanh, c
     initial_state = nn.tile(initial_state, [batch_size, 1])
     null_state = tf.zeros_like(initial_state)
     mask = nn.drop_mask([batch_size, recur_size], recur_keep_prob)
+    if segment_ids is not None:
+      # Packed rows go back to the initial state wherever a new sentence starts
+      # (n x m) -> (n x m)
+      resets = tf.not_equal(segment_ids, tf.pad(segment_ids[:,:-1], [[0,0], [1,0]]))
+      reset_sequence = tf.TensorArray(tf.bool, size=bucket_size)
+      reset_sequence = reset_sequence.unstack(tf.transpose(resets, [1,0]))
 
     # Set up the loop
     #-------------------------------------------------------------
@@ -169,6 +175,8 @@ def LSTM(layer, recur_size, seq_lengths, conv_width=0, recur_func=nonlin.tanh, c
       return i < bucket_size
     #-------------------------------------------------------------
     def body(i, last_state, last_state_sequence):
+      if segment_ids is not None:
+        last_state = tf.where(reset_sequence.read(i), initial_state, last_state)
       last_hidden, last_cell = tf.split(last_state, 2, axis=1)
       current_partial_input = input_sequence.read(i)
       if recur_keep_prob < 1:
@@ -240,6 +248,8 @@ def BiRNN(layer, recur_size, seq_lengths, recur_cell=LSTM, bilin=False, **kwargs
   with tf.variable_scope('RNN_FW'):
     fw_hidden, fw_cell = recur_cell(layer, recur_size, seq_lengths, **kwargs)
   rev_layer = tf.reverse_sequence(layer, seq_lengths, batch_axis=0, seq_axis=1)
+  if kwargs.get('segment_ids') is not None:
+    kwargs['segment_ids'] = tf.reverse_sequence(kwargs['segment_ids'], seq_lengths, batch_axis=0, seq_axis=1)
   with tf.variable_scope('RNN_BW'):
     bw_hidden, bw_cell = recur_cell(rev_layer, recur_size, seq_lengths, **kwargs)
   rev_bw_hidden = tf.reverse_sequence(bw_hidden, seq_lengths, batch_axis=0, seq_axis=1)
@@ -70,6 +70,16 @@ class ParserNetwork(BaseNetwork):
     n_tokens = tf.reduce_sum(tokens_per_sequence)
     n_sequences = tf.count_nonzero(tokens_per_sequence)
     seq_lengths = tokens_per_sequence+1
+    if self.pack_sentences:
+      # Rows may hold several sentences, each with its own root
+      # (n x m) -> (n x m)
+      segment_ids = nn.segment_ids(self.id_vocab.placeholder)
+      # (n x m) -> (n)
+      seq_lengths = tf.count_nonzero(segment_ids, axis=1, dtype=tf.int32)
+      # (n x m) -> (n x m x m)
+      attention_mask = nn.segment_mask(segment_ids)
+    else:
+      segment_ids = attention_mask = None
     tokens = {'n_tokens': n_tokens,
               'tokens_per_sequence': tokens_per_sequence,
               'token_weights': token_weights,
@@ -93,7 +103,8 @@ class ParserNetwork(BaseNetwork):
                                           cifg=self.cifg,
                                           highway=self.highway,
                                           highway_func=self.highway_func,
-                                          bilin=self.bilin)
+                                          bilin=self.bilin,
+                                          segment_ids=segment_ids)
   
     output_fields = {vocab.field: vocab for vocab in self.output_vocabs}
     outputs = {}
@@ -106,16 +117,19 @@ class ParserNetwork(BaseNetwork):
             unlabeled_outputs = head_vocab.get_bilinear_classifier(
               layer,
               token_weights=token_weights,
-              reuse=reuse)
+              reuse=reuse,
+              attention_mask=attention_mask)
           with tf.variable_scope('Labeled'):
             labeled_outputs = vocab.get_bilinear_classifier(
               layer, unlabeled_outputs,
               token_weights=token_weights,
-              reuse=reuse)
+              reuse=reuse,
+              attention_mask=attention_mask)
         else:
           labeled_outputs = vocab.get_unfactored_bilinear_classifier(layer, head_vocab.placeholder,
             token_weights=token_weights,
-            reuse=reuse)
+            reuse=reuse,
+            attention_mask=attention_mask)
         outputs['deptree'] = labeled_outputs
         self._evals.add('deptree')
         if 'ufeats' in output_fields:
@@ -130,7 +144,8 @@ class ParserNetwork(BaseNetwork):
         outputs[vocab.classname] = vocab.get_bilinear_classifier(
           layer,
           token_weights=token_weights,
-          reuse=reuse)
+          reuse=reuse,
+          attention_mask=attention_mask)
         self._evals.add('dephead')
     
     return outputs, tokens
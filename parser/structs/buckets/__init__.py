@@ -1,2 +1,3 @@
 from .dict_multibucket import DictMultibucket
 from .list_multibucket import ListMultibucket
+from .string_table import StringTable
@@ -59,6 +59,20 @@ class BaseBucket(object):
     
     return
   
+  #=============================================================
+  def get_arrays(self):
+    """"""
+    
+    return {'data': self.data}
+  
+  #=============================================================
+  def set_arrays(self, arrays):
+    """"""
+    
+    self._data = arrays['data']
+    self._is_open = False
+    return
+  
   #=============================================================
   @property
   def idx(self):
@@ -18,6 +18,7 @@
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
+import six
 
 from collections import Counter
 
@@ -67,6 +68,9 @@ class BaseMultibucket(object):
   @property
   def max_buckets(self):
     return self._max_buckets
+  @property
+  def bucketing(self):
+    return self._config.getstr(self, 'bucketing')
   
   #=============================================================
   @staticmethod
@@ -80,6 +84,52 @@ class BaseMultibucket(object):
       prevlen = max_length
     return len2bkt
   
+  #=============================================================
+  def get_max_lengths(self, lengths):
+    """"""
+    
+    if self.bucketing == 'greedy':
+      return self.compute_max_lengths(lengths, self.max_buckets)
+    elif self.bucketing == 'linear':
+      return self.compute_optimal_max_lengths(lengths, self.max_buckets, power=1)
+    elif self.bucketing == 'quadratic':
+      return self.compute_optimal_max_lengths(lengths, self.max_buckets, power=2)
+    else:
+      raise ValueError('bucketing must be one of greedy, linear or quadratic (got {})'.format(self.bucketing))
+  
+  #=============================================================
+  @staticmethod
+  def compute_optimal_max_lengths(lengths, max_buckets, power=1):
+    """"""
+    
+    # Each sequence costs max_length**power cells in its bucket. Only the distinct
+    # lengths can be boundaries, so this is an exact DP over them where
+    # costs[j] is the cheapest way to cover the j+1 shortest lengths
+    counts = np.bincount(np.asarray(lengths, dtype=np.int64))
+    uniq_lengths = np.nonzero(counts)[0]
+    cum_counts = np.cumsum(counts[uniq_lengths]).astype(np.float64)
+    n_lengths = len(uniq_lengths)
+    n_buckets = min(max_buckets, n_lengths)
+    
+    # bucket_costs[i, j] is the cost of one bucket holding lengths i through j
+    widths = uniq_lengths.astype(np.float64)**power
+    prev_counts = np.concatenate([[0], cum_counts[:-1]])
+    bucket_costs = widths[None,:] * (cum_counts[None,:] - prev_counts[:,None])
+    bucket_costs[np.tril_indices(n_lengths, -1)] = np.inf
+    
+    costs = bucket_costs[0]
+    backpointers = []
+    for _ in six.moves.range(1, n_buckets):
+      # The new last bucket starts at i, after a cover of the first i lengths
+      candidates = costs[:-1,None] + bucket_costs[1:]
+      backpointers.append(np.argmin(candidates, axis=0) + 1)
+      costs = np.concatenate([[np.inf], np.min(candidates, axis=0)[1:]])
+    
+    splits = [n_lengths-1]
+    for backpointer in reversed(backpointers):
+      splits.append(backpointer[splits[-1]] - 1)
+    return [int(uniq_lengths[split]) for split in reversed(splits)]
+  
   #=============================================================
   @staticmethod
   def compute_max_lengths(lengths, max_buckets):
@@ -38,6 +38,8 @@ class DictBucket(BaseBucket):
     self._indices = []
     self._tokens = []
     self._str2idx = {}
+    self._offsets = None
+    self._max_length = 0
     
     return
   
@@ -76,35 +78,76 @@ class DictBucket(BaseBucket):
     shape = [first_dim, second_dim]
     if self.depth > 0:
       shape.append(self.depth)
-    elif self.depth == -1:
-      shape.append(shape[-1])
     
-    data = np.zeros(shape, dtype=np.int32)
-    # Add data to the index matrix
     if self.depth >= 0:
+      data = np.zeros(shape, dtype=np.int32)
+      # Add data to the index matrix
       try:
         for i, sequence in enumerate(self._indices):
-          if sequence:
+          if len(sequence):
             data[i, 0:len(sequence)] = sequence
       except ValueError:
         print('Expected shape: {}\nsequence: {}'.format([len(sequence), self.depth], sequence))
         print('\ntokens: {}'.format(self._tokens[i]))
         raise
     elif self.depth == -1:
-      # for graphs, sequence should be list of (idx, val) pairs
-      for i, sequence in enumerate(self._indices):
-        for j, node in enumerate(sequence):
-          for edge in node:
-            if isinstance(edge, (tuple, list)):
-              edge, v = edge
-              data[i, j, edge] = v
-            else:
-              data[i, j, edge] = 1
+      # for graphs, sequence should be list of (idx, val) pairs; they're kept as a
+      # list of (sequence, dependent, head, label) edges sorted by sequence, and the
+      # dense [n, len, len] matrix is only built for each batch in get_data
+      edges = [(i, j) + (tuple(edge) if isinstance(edge, (tuple, list)) else (edge, 1))
+               for i, sequence in enumerate(self._indices)
+               for j, node in enumerate(sequence)
+               for edge in node]
+      edges = np.array(edges, dtype=np.int32).reshape([-1, 4])
+      self._offsets = np.zeros(first_dim+1, dtype=np.int64)
+      self._offsets[1:] = np.cumsum(np.bincount(edges[:,0], minlength=first_dim))
+      self._max_length = second_dim
+      data = edges[:,1:]
     
     super(DictBucket, self).close(data)
     
     return
   
+  #=============================================================
+  def get_data(self, data_indices, max_length=None):
+    """"""
+    
+    if max_length is None:
+      max_length = self._max_length if self.depth == -1 else self.data.shape[1]
+    if self.depth != -1:
+      return self.data[data_indices, :max_length]
+    
+    # Gather each sequence's edges and scatter them into a dense matrix
+    data_indices = np.asarray(data_indices)
+    starts = self._offsets[data_indices]
+    counts = self._offsets[data_indices+1] - starts
+    batch_indices = np.repeat(np.arange(len(data_indices)), counts)
+    edge_indices = np.arange(np.sum(counts)) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    dependents, heads, labels = self.data[edge_indices].T
+    data = np.zeros([len(data_indices), max_length, max_length], dtype=np.int32)
+    data[batch_indices, dependents, heads] = labels
+    return data
+  
+  #=============================================================
+  def get_arrays(self):
+    """"""
+    
+    arrays = super(DictBucket, self).get_arrays()
+    if self.depth == -1:
+      arrays['offsets'] = self._offsets
+      arrays['max_length'] = np.array(self._max_length)
+    return arrays
+  
+  #=============================================================
+  def set_arrays(self, arrays):
+    """"""
+    
+    super(DictBucket, self).set_arrays(arrays)
+    if self.depth == -1:
+      self._offsets = arrays['offsets']
+      self._max_length = int(arrays['max_length'])
+    return
+  
   #=============================================================
   @property
   def depth(self):
@@ -24,13 +24,14 @@ import numpy as np
 
 from .base_multibucket import BaseMultibucket
 from .dict_bucket import DictBucket
+from .string_table import StringTable
  
 #***************************************************************
 class DictMultibucket(BaseMultibucket, dict):
   """"""
   
   #=============================================================
-  def __init__(self, vocabs, max_buckets=2, config=None):
+  def __init__(self, vocabs, max_buckets=2, raw_fields=(), config=None):
     """"""
     
     super(DictMultibucket, self).__init__(max_buckets, config=config)
@@ -39,9 +40,12 @@ class DictMultibucket(BaseMultibucket, dict):
     for vocab in vocabs:
       self[vocab.classname] = [DictBucket(idx, vocab.depth, config=config) for idx in six.moves.range(max_buckets)]
     
+    # Raw fields only keep their tokens, without any buckets or indices
+    self._raw_fields = list(raw_fields)
     self._lengths = []
     self._indices = {vocab.classname: [] for vocab in vocabs}
     self._tokens = {vocab.classname: [] for vocab in vocabs}
+    self._tokens.update({field: [] for field in self._raw_fields})
     self._max_lengths = []
     return
   
@@ -52,6 +56,7 @@ class DictMultibucket(BaseMultibucket, dict):
     self._lengths = []
     self._indices = {vocab.classname: [] for vocab in vocabs}
     self._tokens = {vocab.classname: [] for vocab in vocabs}
+    self._tokens.update({field: [] for field in self._raw_fields})
     for vocab_classname in self:
       for bucket in self[vocab_classname]:
         bucket.reset()
@@ -78,7 +83,7 @@ class DictMultibucket(BaseMultibucket, dict):
     
     # Decide where everything goes
     self._lengths = np.array(self._lengths)
-    self._max_lengths = self.compute_max_lengths(self._lengths, self.max_buckets)
+    self._max_lengths = self.get_max_lengths(self._lengths) if len(self._lengths) else []
     len2bkt = self.get_len2bkt(self._max_lengths)
     
     # Open the buckets
@@ -116,14 +121,81 @@ class DictMultibucket(BaseMultibucket, dict):
     
     bucket_index = bucket_index[0]
     data_indices = self.data[vocab_classname][indices]
-    data = self[vocab_classname][bucket_index].data[data_indices]
+    # Padding only ever comes at the end, so trim it to the longest requested sequence
+    max_length = np.max(self.lengths[indices])
+    data = self[vocab_classname][bucket_index].get_data(data_indices, max_length=max_length)
     return data
   
   #=============================================================
   def get_tokens(self, vocab_classname, indices):
     """"""
     
-    return [self._tokens[vocab_classname][index] for index in indices]
+    tokens = self._tokens[vocab_classname]
+    if isinstance(tokens, StringTable):
+      return [tokens[index].split('\t') for index in indices]
+    return [tokens[index] for index in indices]
+  
+  #=============================================================
+  def get_arrays(self, vocabs, types):
+    """"""
+    
+    arrays = {'lengths': np.asarray(self._lengths),
+              'max_lengths': np.asarray(self._max_lengths),
+              'data': self.data}
+    for vocab in vocabs:
+      for bucket in self[vocab.classname]:
+        for name, array in six.iteritems(bucket.get_arrays()):
+          if name == 'data':
+            # Vocabs whose indices depend on what else has been loaded store them relative to `types`
+            array = vocab.localize_indices(array, types)
+          arrays['{}-{}-{}'.format(vocab.classname, bucket.idx, name)] = array
+      
+      tokens = self._tokens[vocab.classname]
+      if not isinstance(tokens, StringTable):
+        tokens = StringTable.from_strings([u'\t'.join(sent_tokens) for sent_tokens in tokens])
+      arrays[vocab.classname+'-tokens-blob'] = tokens.blob
+      arrays[vocab.classname+'-tokens-offsets'] = tokens.offsets
+    for field in self._raw_fields:
+      tokens = self._tokens[field]
+      if not isinstance(tokens, StringTable):
+        tokens = StringTable.from_strings([u'\t'.join(sent_tokens) for sent_tokens in tokens])
+      arrays['raw-'+field+'-tokens-blob'] = tokens.blob
+      arrays['raw-'+field+'-tokens-offsets'] = tokens.offsets
+    return arrays
+  
+  #=============================================================
+  def set_arrays(self, vocabs, arrays, types):
+    """"""
+    
+    self._lengths = arrays['lengths']
+    self._max_lengths = list(arrays['max_lengths'])
+    for vocab in vocabs:
+      remap = vocab.merge_types(types)
+      for bucket in self[vocab.classname]:
+        prefix = '{}-{}-'.format(vocab.classname, bucket.idx)
+        bucket_arrays = {name[len(prefix):]: array for name, array in six.iteritems(arrays) if name.startswith(prefix)}
+        if remap is not None:
+          bucket_arrays['data'] = vocab.remap_indices(bucket_arrays['data'], remap)
+        bucket.set_arrays(bucket_arrays)
+      self._tokens[vocab.classname] = StringTable(arrays[vocab.classname+'-tokens-blob'], arrays[vocab.classname+'-tokens-offsets'])
+    for field in self._raw_fields:
+      self._tokens[field] = StringTable(arrays['raw-'+field+'-tokens-blob'], arrays['raw-'+field+'-tokens-offsets'])
+    super(DictMultibucket, self).close(arrays['data'])
+    return
+  
+  #=============================================================
+  def merge_types(self, vocabs, types):
+    """"""
+    
+    # For multibuckets that were filled with indices relative to `types`
+    for vocab in vocabs:
+      remap = vocab.merge_types(types)
+      if remap is not None:
+        for bucket in self[vocab.classname]:
+          arrays = bucket.get_arrays()
+          arrays['data'] = vocab.remap_indices(arrays['data'], remap)
+          bucket.set_arrays(arrays)
+    return
   
   #=============================================================
   @property
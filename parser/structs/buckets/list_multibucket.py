@@ -88,7 +88,7 @@ class ListMultibucket(BaseMultibucket, list):
     """"""
     
     # Decide where everything goes
-    max_lengths = self.compute_max_lengths(self._lengths, self.max_buckets)
+    max_lengths = self.get_max_lengths(self._lengths)
     len2bkt = self.get_len2bkt(max_lengths)
     
     # Open the buckets
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Copyright 2017 Timothy Dozat
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import six
+
+import bisect
+
+import numpy as np
+
+#***************************************************************
+# Strings are stored as one utf-8 byte array plus offsets so that the
+# table can be written with np.save and memory-mapped back in
+class StringTable(object):
+  """"""
+
+  #=============================================================
+  def __init__(self, blob, offsets):
+    """"""
+
+    self._blob = blob
+    self._offsets = offsets
+    return
+
+  #=============================================================
+  @classmethod
+  def from_strings(cls, strings):
+    """"""
+
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded)+1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(string) for string in encoded], dtype=np.int64)
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return cls(blob, offsets)
+
+  #=============================================================
+  def tolist(self):
+    """"""
+
+    # One copy of the blob and plain int offsets, instead of a numpy slice per string
+    data = self._blob.tobytes()
+    offsets = self._offsets.tolist()
+    return [data[start:stop].decode('utf-8') for start, stop in zip(offsets[:-1], offsets[1:])]
+
+  #=============================================================
+  def searchsorted(self, string):
+    """"""
+
+    # Like np.searchsorted(side='left') for a table of sorted strings; only the probed strings get decoded
+    return bisect.bisect_left(self, string)
+
+  #=============================================================
+  @property
+  def blob(self):
+    return self._blob
+  @property
+  def offsets(self):
+    return self._offsets
+
+  #=============================================================
+  def __getitem__(self, index):
+    return self._blob[self._offsets[index]:self._offsets[index+1]].tobytes().decode('utf-8')
+  def __len__(self):
+    return len(self._offsets) - 1
+  def __iter__(self):
+    return (self[index] for index in six.moves.range(len(self)))
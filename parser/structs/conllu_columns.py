@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Copyright 2017 Timothy Dozat
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import six
+
+import os
+import sys
+import multiprocessing
+import zipfile
+import gzip
+try:
+  import lzma
+except ImportError:
+  try:
+    from backports import lzma
+  except ImportError:
+    import warnings
+    warnings.warn('Install backports.lzma for xz support')
+from contextlib import contextmanager
+from collections import Counter
+
+import numpy as np
+
+#***************************************************************
+# A block of sentences stored column-wise: the utf-8 bytes of its token
+# lines, the CoNLL-U field each byte belongs to, and sentence offsets. A
+# column is only decoded (all at once) when a vocab first asks for it.
+class CoNLLUColumns(object):
+  """"""
+
+  n_columns = 10
+  block_size = 2**24
+
+  #=============================================================
+  def __init__(self, data, fields, offsets):
+    """"""
+
+    self._data = data
+    self._fields = fields
+    self._offsets = offsets
+    self._columns = {}
+    return
+
+  #=============================================================
+  @classmethod
+  def from_bytes(cls, data):
+    """"""
+
+    data = data.replace(b'\r', b'')
+    if not data.endswith(b'\n'):
+      data += b'\n'
+    data = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(data == ord('\n'))
+    starts = np.zeros_like(ends)
+    starts[1:] = ends[:-1] + 1
+
+    # Blank lines and comments end sentences
+    firsts = data[np.minimum(starts, len(data)-1)]
+    breaks = (starts == ends) | (firsts == ord('#'))
+    for line_idx in np.flatnonzero(((firsts == ord(' ')) | (firsts == ord('\t'))) & ~breaks):
+      line = data[starts[line_idx]:ends[line_idx]].tobytes().strip()
+      breaks[line_idx] = not line or line.startswith(b'#')
+    # Multiword tokens and empty nodes have a '-' or '.' before the first tab
+    tabs = np.flatnonzero(data == ord('\t'))
+    first_tabs = np.append(tabs, len(data))[np.searchsorted(tabs, starts)]
+    first_tabs = np.minimum(first_tabs, ends)
+    marks = np.flatnonzero((data == ord('-')) | (data == ord('.')))
+    first_marks = np.append(marks, len(data))[np.searchsorted(marks, starts)]
+    tokens = ~breaks & (first_marks >= first_tabs)
+
+    sent_lengths = np.bincount(np.cumsum(breaks)[tokens])
+    sent_lengths = sent_lengths[sent_lengths > 0]
+    offsets = np.zeros(len(sent_lengths)+1, dtype=np.int64)
+    offsets[1:] = np.cumsum(sent_lengths)
+
+    # Keep only the token lines (with their newlines)
+    data = data[np.repeat(tokens, ends-starts+1)]
+    fields = cls.get_fields(data)
+    if fields is None:
+      # Some line doesn't have exactly ten fields, so split it line by line and pad with '_'
+      lines = []
+      for line in data.tobytes().decode('utf-8', 'ignore').split('\n')[:-1]:
+        line = line.strip().split('\t')[:cls.n_columns]
+        line.extend(['_'] * (cls.n_columns - len(line)))
+        lines.append('\t'.join(line) + '\n')
+      data = np.frombuffer(''.join(lines).encode('utf-8'), dtype=np.uint8)
+      fields = cls.get_fields(data)
+    return cls(data, fields, offsets)
+
+  #=============================================================
+  @classmethod
+  def get_fields(cls, data):
+    """"""
+
+    # Number the field every byte belongs to; tabs and newlines go with the field they end
+    is_tab = (data == ord('\t')).astype(np.int32)
+    n_tabs = np.cumsum(is_tab)
+    ends = np.flatnonzero(data == ord('\n'))
+    line_tabs = np.diff(np.append(0, n_tabs[ends]))
+    if np.any(line_tabs != cls.n_columns-1):
+      return None
+    line_bases = np.append(0, n_tabs[ends[:-1]])
+    return (n_tabs - is_tab - np.repeat(line_bases, np.diff(np.append(-1, ends)))).astype(np.int8)
+
+  #=============================================================
+  def get_column(self, conllu_idx):
+    """"""
+
+    column = self._columns.get(conllu_idx)
+    if column is None:
+      # Every field is followed by a tab, except the last one which is followed by a newline
+      terminator = '\n' if conllu_idx == self.n_columns-1 else '\t'
+      column = self._data[self._fields == conllu_idx].tobytes().decode('utf-8', 'ignore')
+      column = self._columns[conllu_idx] = column.split(terminator)[:-1]
+    return column
+
+  #=============================================================
+  @classmethod
+  def iterblocks(cls, conllu_file, byte_range=None):
+    """"""
+
+    with cls.open(conllu_file, byte_range=byte_range) as (f, size):
+      carry = b''
+      while True:
+        block = f.read(cls.block_size if size is None else min(cls.block_size, size))
+        if size is not None:
+          size -= len(block)
+        if not block or size == 0:
+          # Last block
+          carry += block
+          if carry.strip():
+            yield cls.from_bytes(carry)
+          break
+        # Only split after a blank line, so no sentence or utf-8 character is cut in half
+        carry += block.replace(b'\r', b'')
+        split = carry.rfind(b'\n\n')
+        if split > -1:
+          yield cls.from_bytes(carry[:split+1])
+          carry = carry[split+2:]
+
+  #=============================================================
+  @classmethod
+  def itersents(cls, conllu_file, byte_range=None):
+    """"""
+
+    for block in cls.iterblocks(conllu_file, byte_range=byte_range):
+      for sent in block:
+        yield sent
+
+  #=============================================================
+  @staticmethod
+  def count_columns(conllu_files, conllu_idxs, n_workers=1):
+    """"""
+
+    # One pass over every file, counting all the requested columns at once
+    args = [(conllu_file, tuple(conllu_idxs)) for conllu_file in conllu_files]
+    if n_workers > 1 and len(args) > 1:
+      with multiprocessing.get_context('fork').Pool(min(n_workers, len(args))) as pool:
+        file_counts = pool.map(_count_file, args)
+    else:
+      file_counts = [_count_file(arg) for arg in args]
+
+    # Merge in file order so that first occurrences stay in order
+    counts = {conllu_idx: Counter() for conllu_idx in conllu_idxs}
+    for file_count in file_counts:
+      for conllu_idx in conllu_idxs:
+        counts[conllu_idx].update(file_count[conllu_idx])
+    return counts
+
+  #=============================================================
+  @staticmethod
+  @contextmanager
+  def open(conllu_file, byte_range=None):
+    """"""
+
+    if byte_range is not None:
+      with open(conllu_file, 'rb') as f:
+        f.seek(byte_range[0])
+        yield f, byte_range[1] - byte_range[0]
+    elif conllu_file == '-':
+      # Read from a duplicate of stdin so that closing it leaves sys.stdin alone
+      with os.fdopen(os.dup(sys.stdin.fileno()), 'rb') as f:
+        yield f, None
+    elif conllu_file.endswith('.zip'):
+      with zipfile.ZipFile(conllu_file, 'r') as archive:
+        with archive.open(archive.namelist()[0], 'r') as f:
+          yield f, None
+    elif conllu_file.endswith('.gz'):
+      with gzip.open(conllu_file, 'rb') as f:
+        yield f, None
+    elif conllu_file.endswith('.xz'):
+      with lzma.open(conllu_file, 'rb') as f:
+        yield f, None
+    else:
+      with open(conllu_file, 'rb') as f:
+        yield f, None
+
+  #=============================================================
+  @property
+  def columns(self):
+    return [self.get_column(conllu_idx) for conllu_idx in six.moves.range(self.n_columns)]
+  @property
+  def offsets(self):
+    return self._offsets
+  @property
+  def n_tokens(self):
+    return self._offsets[-1]
+
+  #=============================================================
+  def __getitem__(self, sent_idx):
+    return CoNLLUSentence(self, int(self._offsets[sent_idx]), int(self._offsets[sent_idx+1]))
+  def __len__(self):
+    return len(self._offsets) - 1
+  def __iter__(self):
+    offsets = self._offsets.tolist()
+    return (CoNLLUSentence(self, start, stop) for start, stop in zip(offsets[:-1], offsets[1:]))
+
+#***************************************************************
+# A view of one sentence in a CoNLLUColumns block. It can still be used as
+# a list of split lines, but vocabs should ask for whole columns instead.
+class CoNLLUSentence(object):
+  """"""
+
+  #=============================================================
+  def __init__(self, block, start, stop):
+    """"""
+
+    self._block = block
+    self._start = start
+    self._stop = stop
+    return
+
+  #=============================================================
+  def column(self, conllu_idx):
+    """"""
+
+    return self._block.get_column(conllu_idx)[self._start:self._stop]
+
+  #=============================================================
+  def __getitem__(self, token_idx):
+    return [column[self._start:self._stop][token_idx] for column in self._block.columns]
+  def __len__(self):
+    return self._stop - self._start
+  def __iter__(self):
+    return (list(line) for line in zip(*[column[self._start:self._stop] for column in self._block.columns]))
+
+#***************************************************************
+def _count_file(args):
+  conllu_file, conllu_idxs = args
+  counts = {conllu_idx: Counter() for conllu_idx in conllu_idxs}
+  for block in CoNLLUColumns.iterblocks(conllu_file):
+    for conllu_idx in conllu_idxs:
+      counts[conllu_idx].update(block.get_column(conllu_idx))
+  return counts
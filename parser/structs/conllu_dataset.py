@@ -22,7 +22,13 @@ import six
 
 import os
 import re
+import sys
 import codecs
+import time
+import shutil
+import hashlib
+import threading
+import multiprocessing
 import zipfile
 import gzip
 try:
@@ -33,31 +39,48 @@ except ImportError:
   except ImportError:
     import warnings
     warnings.warn('Install backports.lzma for xz support')
+from itertools import islice
 from collections import Counter
+from six.moves.queue import Queue, Empty
 
 import numpy as np
 import tensorflow as tf
 
-from parser.structs.buckets import DictMultibucket
+from parser.structs.buckets import DictMultibucket, StringTable
+from parser.structs.conllu_columns import CoNLLUColumns
  
 #***************************************************************
 class CoNLLUDataset(set):
   """"""
   
+  _cache_version = 2
+  # Held while feed_dicts are built in the background and while the (shared) vocabs are modified
+  _vocab_lock = threading.RLock()
+  
   #=============================================================
-  def __init__(self, conllu_files, vocabs, config=None):
+  def __init__(self, conllu_files, vocabs, raw_columns=(), config=None):
     """"""
     
     super(CoNLLUDataset, self).__init__(vocabs)
     
-    self._multibucket = DictMultibucket(vocabs, max_buckets=config.getint(self, 'max_buckets'), config=config)
+    # (field, conllu_idx) pairs that are only copied from the input to the output
+    self._raw_columns = list(raw_columns)
+    self._multibucket = DictMultibucket(vocabs, max_buckets=config.getint(self, 'max_buckets'), raw_fields=self.raw_fields, config=config)
     self._is_open = False
     self._config = config
     self._conllu_files = conllu_files
     assert len(conllu_files) > 0, "You didn't pass in any valid CoNLLU files! Maybe you got the path wrong?"
     self._cur_file_idx = -1
+    self._feed_time = 0
+    self._wait_time = 0
+    self._staged = None
+    self._batch_stats = None
+    self._shard_pool = self.open_shard_pool() if self.n_workers > 1 else None
     
     self.load_next()
+    if len(self.conllu_files) == 1:
+      # A single file is never loaded again, so its workers aren't needed anymore
+      self.close_shard_pool()
     return
   
   #=============================================================
@@ -74,15 +97,254 @@ class CoNLLUDataset(set):
     """"""
     
     if self._cur_file_idx == -1 or len(self.conllu_files) > 1:
-      self.reset()
-    
       if file_idx is None:
         self._cur_file_idx = (self._cur_file_idx + 1) % len(self.conllu_files)
         file_idx = self._cur_file_idx
+      conllu_file = self.conllu_files[file_idx]
+      staged = self.pop_staged(file_idx)
       
-      with self.open():
-        for sent in self.itersents(self.conllu_files[file_idx]):
-          self.add(sent)
+      with self._vocab_lock:
+        self.reset()
+        
+        if staged is not None:
+          cache_dirname, multibucket, types = staged
+        else:
+          cache_dirname, multibucket, types = self.get_cache_dirname(conllu_file), None, None
+        if multibucket is not None:
+          self.load_staged(multibucket, types)
+        elif cache_dirname is not None and os.path.isdir(cache_dirname):
+          self.load_cache(cache_dirname)
+          cache_dirname = None
+        elif self._shard_pool is not None:
+          self.load_shards(conllu_file)
+        else:
+          with self.open():
+            for sent in self.iterfile(conllu_file):
+              self.add(sent)
+        if cache_dirname is not None:
+          self.dump_cache(cache_dirname)
+      
+      if self.prefetch_files and len(self.conllu_files) > 1:
+        self.stage_next((self._cur_file_idx + 1) % len(self.conllu_files))
+    return
+  
+  #=============================================================
+  def stage_next(self, file_idx):
+    """"""
+    
+    # Parse, index and bucket the next file in the background while the
+    # current one is being trained on; load_next swaps it in when it's done
+    result = []
+    def stage():
+      try:
+        result.append(self.stage_file(self.conllu_files[file_idx]))
+      except Exception as e:
+        result.append(e)
+      return
+    thread = threading.Thread(target=stage)
+    thread.daemon = True
+    thread.start()
+    self._staged = (file_idx, thread, result)
+    return
+  
+  #=============================================================
+  def pop_staged(self, file_idx):
+    """"""
+    
+    if self._staged is None:
+      return None
+    staged_idx, thread, result = self._staged
+    self._staged = None
+    thread.join()
+    if isinstance(result[0], Exception):
+      raise result[0]
+    if staged_idx != file_idx:
+      return None
+    return result[0]
+  
+  #=============================================================
+  def stage_file(self, conllu_file):
+    """"""
+    
+    cache_dirname = self.get_cache_dirname(conllu_file)
+    if cache_dirname is not None and os.path.isdir(cache_dirname):
+      return cache_dirname, None, None
+    
+    # This runs in the staging thread while the main thread is in sess.run, so it must never
+    # fork: the shards go to the pool forked before the session, or are encoded right here
+    if self._shard_pool is not None:
+      results = self.encode_shards(conllu_file)
+    else:
+      results = [self.encode_shard(conllu_file)]
+    
+    # Nothing shared gets touched here: the shards' types are merged into
+    # one more table of local types, which load_staged merges into the vocabs
+    types = {}
+    multibucket = DictMultibucket(self, max_buckets=self.max_buckets, raw_fields=self.raw_fields, config=self._config)
+    with multibucket.open():
+      for sents, shard_types in results:
+        remaps = {vocab.classname: vocab.merge_types(shard_types, into=types) for vocab in self}
+        for sent_tokens, sent_indices, length in sents:
+          for vocab in self:
+            sent_indices[vocab.classname] = vocab.remap_indices(sent_indices[vocab.classname], remaps[vocab.classname])
+          multibucket.add(sent_indices, sent_tokens, length=length)
+    return cache_dirname, multibucket, types
+  
+  #=============================================================
+  def load_staged(self, multibucket, types):
+    """"""
+    
+    for vocab in self:
+      vocab.open()
+    multibucket.merge_types(self, types)
+    for vocab in self:
+      vocab.close()
+    self._multibucket = multibucket
+    return
+  
+  #=============================================================
+  def load_shards(self, conllu_file):
+    """"""
+    
+    results = self.encode_shards(conllu_file)
+    
+    # Merge the shards back in file order so the buckets come out the same every time
+    with self.open():
+      for sents, types in results:
+        remaps = {vocab.classname: vocab.merge_types(types) for vocab in self}
+        for sent_tokens, sent_indices, length in sents:
+          for vocab in self:
+            sent_indices[vocab.classname] = vocab.remap_indices(sent_indices[vocab.classname], remaps[vocab.classname])
+          self._multibucket.add(sent_indices, sent_tokens, length=length)
+    return
+  
+  #=============================================================
+  def open_shard_pool(self):
+    """"""
+    
+    # Workers are forked once, when the dataset is built and before any session starts,
+    # so they never inherit the session's threads. They inherit the vocabs instead of
+    # pickling them, and only read from them, encoding stateful columns relative to their own types
+    global _shard_dataset
+    _shard_dataset = self
+    try:
+      pool = multiprocessing.get_context('fork').Pool(self.n_workers)
+    finally:
+      _shard_dataset = None
+    return pool
+  
+  #=============================================================
+  def close_shard_pool(self):
+    """"""
+    
+    if self._shard_pool is not None:
+      self._shard_pool.terminate()
+      self._shard_pool.join()
+      self._shard_pool = None
+    return
+  
+  #=============================================================
+  def encode_shards(self, conllu_file):
+    """"""
+    
+    shards = self.get_shards(conllu_file, self.n_workers)
+    return self._shard_pool.map(_encode_shard, [(conllu_file, shard) for shard in shards], chunksize=1)
+  
+  #=============================================================
+  def encode_shard(self, conllu_file, byte_range=None):
+    """"""
+    
+    types = {}
+    sents = []
+    for sent in self.iterfile(conllu_file, byte_range=byte_range):
+      sent_tokens, sent_indices = self.encode(sent, types=types)
+      sents.append((sent_tokens, sent_indices, len(sent)+1))
+    return sents, types
+  
+  #=============================================================
+  @staticmethod
+  def get_shards(conllu_file, n_shards):
+    """"""
+    
+    # Compressed files and stdin can't be seeked into, so they're read by a single worker
+    if conllu_file == '-' or os.path.splitext(conllu_file)[1] in ('.zip', '.gz', '.xz'):
+      return [None]
+    
+    # Move each evenly-spaced offset forward to just past the next blank line
+    size = os.path.getsize(conllu_file)
+    boundaries = [0]
+    with open(conllu_file, 'rb') as f:
+      for i in six.moves.range(1, n_shards):
+        f.seek(max(size * i // n_shards, boundaries[-1]))
+        f.readline()
+        line = f.readline()
+        while line and line.strip():
+          line = f.readline()
+        boundaries.append(f.tell())
+    boundaries.append(size)
+    return [(start, stop) for start, stop in zip(boundaries[:-1], boundaries[1:]) if stop > start]
+  
+  #=============================================================
+  def get_cache_dirname(self, conllu_file):
+    """"""
+    
+    if not self.cache_dir:
+      return None
+    
+    # Key on the file contents, the vocabs' index mappings and the bucket settings
+    digest = hashlib.sha1()
+    digest.update(u'{} {} {} {}'.format(self._cache_version, self.max_buckets, self._multibucket.bucketing, self._raw_columns).encode('utf-8'))
+    with open(conllu_file, 'rb') as f:
+      for chunk in iter(lambda: f.read(2**20), b''):
+        digest.update(chunk)
+    for vocab in sorted(self, key=lambda vocab: vocab.classname):
+      vocab.update_digest(digest)
+    return os.path.join(self.cache_dir, digest.hexdigest())
+  
+  #=============================================================
+  def dump_cache(self, cache_dirname):
+    """"""
+    
+    types = {}
+    arrays = self._multibucket.get_arrays(self, types)
+    for vocab_classname, vocab_types in six.iteritems(types):
+      table = StringTable.from_strings(sorted(vocab_types, key=vocab_types.get))
+      arrays['types-'+vocab_classname+'-blob'] = table.blob
+      arrays['types-'+vocab_classname+'-offsets'] = table.offsets
+    
+    # Write to a temporary directory first so concurrent runs never see a partial cache
+    tmp_dirname = '{}.{}.tmp'.format(cache_dirname, os.getpid())
+    os.makedirs(tmp_dirname, exist_ok=True)
+    for name, array in six.iteritems(arrays):
+      np.save(os.path.join(tmp_dirname, name+'.npy'), array)
+    try:
+      os.rename(tmp_dirname, cache_dirname)
+    except OSError:
+      shutil.rmtree(tmp_dirname, ignore_errors=True)
+    return
+  
+  #=============================================================
+  def load_cache(self, cache_dirname):
+    """"""
+    
+    arrays = {}
+    for filename in os.listdir(cache_dirname):
+      if filename.endswith('.npy'):
+        arrays[filename[:-4]] = np.load(os.path.join(cache_dirname, filename), mmap_mode='r')
+    
+    types = {}
+    for name in arrays:
+      if name.startswith('types-') and name.endswith('-blob'):
+        vocab_classname = name[len('types-'):-len('-blob')]
+        table = StringTable(arrays[name], arrays['types-'+vocab_classname+'-offsets'])
+        types[vocab_classname] = {token: i for i, token in enumerate(table)}
+    
+    # Only the vocabs get opened; the multibucket is filled straight from the arrays
+    for vocab in self:
+      vocab.open()
+    self._multibucket.set_arrays(self, arrays, types)
+    for vocab in self:
+      vocab.close()
     return
   
   #=============================================================
@@ -102,16 +364,37 @@ class CoNLLUDataset(set):
     
     assert self._is_open, 'The CoNLLUDataset is not open for adding entries'
     
+    sent_tokens, sent_indices = self.encode(sent)
+    self._multibucket.add(sent_indices, sent_tokens, length=len(sent)+1)
+    return
+  
+  #=============================================================
+  def encode(self, sent, types=None):
+    """"""
+    
     sent_tokens = {}
     sent_indices = {}
     for vocab in self:
-      tokens = [line[vocab.conllu_idx] for line in sent]
+      if hasattr(sent, 'column'):
+        tokens = sent.column(vocab.conllu_idx)
+      else:
+        tokens = [line[vocab.conllu_idx] for line in sent]
       tokens.insert(0, vocab.get_root())
-      indices = vocab.add_sequence(tokens) # for graphs, list of (head, label) pairs
+      if types is None:
+        indices = vocab.encode_batch(tokens) # for graphs, list of (head, label) pairs
+      else:
+        indices = vocab.encode_sequence(tokens, types)
       sent_tokens[vocab.classname] = tokens
       sent_indices[vocab.classname] = indices
-    self._multibucket.add(sent_indices, sent_tokens, length=len(sent)+1)
-    return
+    for field, conllu_idx in self._raw_columns:
+      if hasattr(sent, 'column'):
+        tokens = sent.column(conllu_idx)
+      else:
+        tokens = [line[conllu_idx] for line in sent]
+      # The root is never written out, so it only has to hold its place
+      tokens.insert(0, '_')
+      sent_tokens[field] = tokens
+    return sent_tokens, sent_indices
   
   #=============================================================
   def close(self):
@@ -137,22 +420,180 @@ class CoNLLUDataset(set):
       if len(subdata) > 0:
         if shuffle:
           np.random.shuffle(subdata)
-        n_splits = max(subdata.shape[0] * bucket_size // self.batch_size, 1)
-        splits = np.array_split(subdata, n_splits)
+        if self.token_budget:
+          splits = self.pack_batches(subdata)
+        else:
+          n_splits = max(subdata.shape[0] * bucket_size // self.batch_size, 1)
+          splits = np.array_split(subdata, n_splits)
         batches.extend(splits)
     if shuffle:
       np.random.shuffle(batches)
+    self._batch_stats = self.get_batch_stats(batches)
     return iter(batches)
+  
+  #=============================================================
+  def pack_batches(self, subdata):
+    """"""
+    
+    # Sort by length (stably, so ties stay shuffled) so that each batch can be trimmed
+    # to its own longest sequence, then cut a new batch whenever the next sequence
+    # would push it over batch_size padded tokens (or batch_size_squared, for the m x m scorers)
+    lengths = self._multibucket.lengths[subdata]
+    order = np.argsort(lengths, kind='mergesort')
+    subdata = subdata[order]
+    lengths = lengths[order]
     
+    batches = []
+    start = 0
+    for stop in six.moves.range(2, len(subdata)+1):
+      n_sents = stop - start
+      max_length = lengths[stop-1]
+      if n_sents * max_length > self.batch_size or \
+         (self.batch_size_squared and n_sents * max_length**2 > self.batch_size_squared):
+        batches.append(subdata[start:stop-1])
+        start = stop-1
+    batches.append(subdata[start:])
+    return batches
+  
+  #=============================================================
+  def get_batch_stats(self, batches):
+    """"""
+    
+    n_tokens = 0
+    n_cells = 0
+    max_cost = (0, 0)
+    for batch in batches:
+      lengths = self._multibucket.lengths[batch]
+      max_length = int(np.max(lengths))
+      n_tokens += int(np.sum(lengths))
+      n_cells += len(batch) * max_length
+      max_cost = max(max_cost, (len(batch) * max_length, len(batch) * max_length**2))
+    return {'n_batches': len(batches),
+            'padding': 1 - n_tokens / n_cells if n_cells else 0,
+            'max_cost': max_cost[0],
+            'max_cost_squared': max_cost[1]}
+  
+  #=============================================================
+  def feed_iterator(self, shuffle=False):
+    """"""
+    
+    batches = self.batch_iterator(shuffle=shuffle)
+    if self.n_prefetch < 1:
+      for batch in batches:
+        start_time = time.time()
+        feed_dict = self.set_placeholders(batch, feed_dict={})
+        self._feed_time += time.time() - start_time
+        self._wait_time += time.time() - start_time
+        yield batch, feed_dict
+      return
+    
+    # Build the feed_dicts for the next n_prefetch batches in a background
+    # thread while the session is busy with the current one
+    queue = Queue(maxsize=self.n_prefetch)
+    stop = threading.Event()
+    errors = []
+    def produce():
+      try:
+        for batch in batches:
+          if stop.is_set():
+            break
+          start_time = time.time()
+          with self._vocab_lock:
+            feed_dict = self.set_placeholders(batch, feed_dict={})
+          queue.put((batch, feed_dict, time.time() - start_time))
+      except Exception as e:
+        errors.append(e)
+      finally:
+        queue.put(None)
+      return
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    
+    try:
+      while True:
+        start_time = time.time()
+        item = queue.get()
+        self._wait_time += time.time() - start_time
+        if item is None:
+          break
+        batch, feed_dict, feed_time = item
+        self._feed_time += feed_time
+        yield batch, feed_dict
+      if errors:
+        raise errors[0]
+    finally:
+      stop.set()
+      while thread.is_alive():
+        try:
+          queue.get(timeout=.01)
+        except Empty:
+          pass
+    return
+  
+  #=============================================================
+  def pop_feed_times(self):
+    """"""
+    
+    feed_times = (self._feed_time, self._wait_time)
+    self._feed_time = 0
+    self._wait_time = 0
+    return feed_times
+  
   #=============================================================
   def set_placeholders(self, indices, feed_dict={}):
     """"""
     
+    segments = self.get_segments(indices)
     for vocab in self:
       data = self._multibucket.get_data(vocab.classname, indices)
+      if segments is not None:
+        assert vocab.depth != -1, 'Graph vocabs cannot be packed'
+        data = self.pack_data(data, segments, positional=vocab.positional)
       feed_dict = vocab.set_placeholders(data, feed_dict=feed_dict)
     return feed_dict
   
+  #=============================================================
+  def get_segments(self, indices):
+    """"""
+    
+    if not self.pack_sentences:
+      return None
+    
+    # Lay the sentences out back to back in rows of pack_length (or the longest sentence)
+    lengths = self._multibucket.lengths[indices]
+    row_length = max(self.pack_length, np.max(lengths))
+    rows = np.zeros_like(lengths)
+    offsets = np.zeros_like(lengths)
+    row = offset = 0
+    for i, length in enumerate(lengths):
+      if offset + length > row_length:
+        row += 1
+        offset = 0
+      rows[i] = row
+      offsets[i] = offset
+      offset += length
+    return rows, offsets, lengths
+  
+  #=============================================================
+  @staticmethod
+  def pack_data(data, segments, positional=False):
+    """"""
+    
+    rows, offsets, lengths = segments
+    # (n x m x ...) -> (r x m' x ...), keeping only each sentence's first `length` entries
+    sent_indices = np.repeat(np.arange(len(lengths)), lengths)
+    positions = np.arange(np.sum(lengths)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    packed_offsets = np.repeat(offsets, lengths)
+    values = data[sent_indices, positions]
+    if positional:
+      # Heads point into the sentence, so they move along with it
+      values = np.where(values >= 0, values + packed_offsets, values)
+    row_length = np.max(packed_offsets + positions) + 1
+    packed_data = np.zeros((rows[-1]+1, row_length) + data.shape[2:], dtype=data.dtype)
+    packed_data[np.repeat(rows, lengths), packed_offsets + positions] = values
+    return packed_data
+  
   #=============================================================
   def get_tokens(self, indices):
     """"""
@@ -161,15 +602,35 @@ class CoNLLUDataset(set):
     token_dict = {}
     for vocab in self:
       token_dict[vocab.field] = self._multibucket.get_tokens(vocab.classname, indices)
+    for field in self.raw_fields:
+      token_dict[field] = self._multibucket.get_tokens(field, indices)
     lengths = self._multibucket.lengths[indices]
     return token_dict, lengths
   
   #=============================================================
-  @staticmethod
-  def itersents(conllu_file):
+  def iterfile(self, conllu_file, byte_range=None):
+    """"""
+    
+    if self.fast_reader:
+      return CoNLLUColumns.itersents(conllu_file, byte_range=byte_range)
+    else:
+      return self.itersents(conllu_file, byte_range=byte_range)
+  
+  #=============================================================
+  @classmethod
+  def itersents(cls, conllu_file, byte_range=None):
     """"""
     
-    if conllu_file.endswith('.zip'):
+    if byte_range is not None:
+      for sent in cls._itersents(cls._iterrange(conllu_file, *byte_range)):
+        yield sent
+      return
+    
+    if conllu_file == '-':
+      # Read from a duplicate of stdin so that closing it leaves sys.stdin alone
+      open_func = lambda conllu_file, mode: os.fdopen(os.dup(sys.stdin.fileno()), mode)
+      kwargs = {'errors': 'ignore'}
+    elif conllu_file.endswith('.zip'):
       open_func = zipfile.Zipfile
       kwargs = {}
     elif conllu_file.endswith('.gz'):
@@ -184,21 +645,43 @@ class CoNLLUDataset(set):
     
     with open_func(conllu_file, 'rb') as f:
       reader = codecs.getreader('utf-8')(f, **kwargs)
-      buff = []
-      for line in reader:
-        line = line.strip()
-        if line and not line.startswith('#'):
-          if not re.match('[0-9]+[-.][0-9]+', line):
-            buff.append(line.split('\t'))
-        elif buff:
-          yield buff
-          buff = []
-      yield buff
+      for sent in cls._itersents(reader):
+        yield sent
+  
+  #=============================================================
+  @staticmethod
+  def _itersents(lines):
+    """"""
+    
+    buff = []
+    for line in lines:
+      line = line.strip()
+      if line and not line.startswith('#'):
+        if not re.match('[0-9]+[-.][0-9]+', line):
+          buff.append(line.split('\t'))
+      elif buff:
+        yield buff
+        buff = []
+    yield buff
+  
+  #=============================================================
+  @staticmethod
+  def _iterrange(conllu_file, start, stop):
+    """"""
+    
+    with open(conllu_file, 'rb') as f:
+      f.seek(start)
+      position = start
+      for line in f:
+        if position >= stop:
+          break
+        position += len(line)
+        yield line.decode('utf-8', 'ignore')
   
   #=============================================================
   @property
   def n_sents(self):
-    return len(self._lengths)
+    return len(self._multibucket.lengths)
   @property
   def save_dir(self):
     return self._config.getstr(self, 'save_dir')
@@ -206,12 +689,48 @@ class CoNLLUDataset(set):
   def conllu_files(self):
     return list(self._conllu_files)
   @property
+  def raw_columns(self):
+    return list(self._raw_columns)
+  @property
+  def raw_fields(self):
+    return [field for field, _ in self._raw_columns]
+  @property
   def max_buckets(self):
     return self._config.getint(self, 'max_buckets')
   @property
   def batch_size(self):
     return self._config.getint(self, 'batch_size')
   @property
+  def batch_stats(self):
+    return self._batch_stats
+  @property
+  def pack_sentences(self):
+    return self._config.getboolean(self, 'pack_sentences')
+  @property
+  def pack_length(self):
+    return self._config.getint(self, 'pack_length')
+  @property
+  def token_budget(self):
+    return self._config.getboolean(self, 'token_budget')
+  @property
+  def batch_size_squared(self):
+    return self._config.getint(self, 'batch_size_squared')
+  @property
+  def cache_dir(self):
+    return self._config.getstr(self, 'cache_dir')
+  @property
+  def n_workers(self):
+    return self._config.getint(self, 'n_workers')
+  @property
+  def n_prefetch(self):
+    return self._config.getint(self, 'n_prefetch')
+  @property
+  def prefetch_files(self):
+    return self._config.getboolean(self, 'prefetch_files')
+  @property
+  def fast_reader(self):
+    return self._config.getboolean(self, 'fast_reader')
+  @property
   def classname(self):
     return self.__class__.__name__
   
@@ -224,6 +743,14 @@ class CoNLLUDataset(set):
     self.close()
     return
 
+#***************************************************************
+# Set by CoNLLUDataset.open_shard_pool right before the worker processes are forked
+_shard_dataset = None
+
+def _encode_shard(args):
+  conllu_file, byte_range = args
+  return _shard_dataset.encode_shard(conllu_file, byte_range=byte_range)
+
 #***************************************************************
 class CoNLLUTrainset(CoNLLUDataset):
   def __init__(self, *args, config=None, **kwargs):
@@ -236,3 +763,55 @@ class CoNLLUDevset(CoNLLUDataset):
 class CoNLLUTestset(CoNLLUDataset):
   def __init__(self, *args, config=None, **kwargs):
     super(CoNLLUTestset, self).__init__(config.getfiles(self, 'test_conllus'), *args, config=config, **kwargs)
+
+#***************************************************************
+class CoNLLUStream(CoNLLUDataset):
+  """"""
+  
+  #=============================================================
+  def __init__(self, conllu_file, vocabs, raw_columns=(), config=None):
+    """"""
+    
+    self._sents = self.itersents(conllu_file)
+    self._exhausted = False
+    super(CoNLLUStream, self).__init__([conllu_file], vocabs, raw_columns=raw_columns, config=config)
+    return
+  
+  #=============================================================
+  def reset(self):
+    """"""
+    
+    # Nothing else reads from the vocabs while streaming, so the types they
+    # accumulate (e.g. the subtoken store) are dropped between chunks too
+    super(CoNLLUStream, self).reset()
+    for vocab in self:
+      vocab.reset_types()
+    return
+  
+  #=============================================================
+  def open_shard_pool(self):
+    """"""
+    
+    # Streams are opened inside the parse session and never read shards, so nothing gets forked
+    return None
+  
+  #=============================================================
+  def load_next(self, file_idx=None):
+    """"""
+    
+    with self._vocab_lock:
+      self.reset()
+      chunk = list(islice(self._sents, self.chunk_size))
+      self._exhausted = len(chunk) < self.chunk_size
+      with self.open():
+        for sent in chunk:
+          self.add(sent)
+    return
+  
+  #=============================================================
+  @property
+  def exhausted(self):
+    return self._exhausted
+  @property
+  def chunk_size(self):
+    return self._config.getint(self, 'chunk_size')
@@ -23,6 +23,7 @@ import six
 import re
 import os
 import codecs
+import itertools
 from collections import Counter
 from collections import defaultdict as DefaultDict
 
@@ -30,6 +31,7 @@ import numpy as np
 import tensorflow as tf
 
 import parser.neural.nn
+from parser.structs.buckets import StringTable
 # id_vocab.root = 0
 # form_vocab.root = <ROOT>
 # lemma_vocab.root = <ROOT>
@@ -44,6 +46,10 @@ class BaseVocab(object):
   """"""
 
   _depth = 0
+  # Whether the indices are positions in the sentence (i.e. heads)
+  _positional = False
+  # Bump this whenever the layout of the binary vocab files changes
+  _binary_version = 1
 
   #=============================================================
   def __init__(self, placeholder_shape=[None, None], config=None):
@@ -78,6 +84,123 @@ class BaseVocab(object):
     feed_dict[self.placeholder] = indices
     return feed_dict
 
+  #=============================================================
+  def encode_batch(self, tokens):
+    """"""
+
+    return self.add_sequence(tokens)
+
+  #=============================================================
+  def decode_batch(self, indices):
+    """"""
+
+    return self[indices]
+
+  #=============================================================
+  def encode_sequence(self, tokens, types):
+    """"""
+
+    return self.encode_batch(tokens)
+
+  #=============================================================
+  def encode_type_keys(self, tokens):
+    """"""
+
+    return self.encode_batch(tokens)
+
+  #=============================================================
+  def get_type_keys(self, indices):
+    """"""
+
+    # What identifies the word type behind an index, for inference-time type tables
+    return np.asarray(indices).tolist()
+
+  #=============================================================
+  def set_type_placeholders(self, keys, feed_dict={}):
+    """"""
+
+    # One word type per row
+    return self.set_placeholders(np.array(keys, dtype=np.int32)[:,None], feed_dict=feed_dict)
+
+  #=============================================================
+  def set_inference(self, inference=True):
+    """"""
+
+    return
+
+  #=============================================================
+  def build_type_table(self, sess):
+    """"""
+
+    return
+
+  #=============================================================
+  def localize_indices(self, indices, types):
+    """"""
+
+    return indices
+
+  #=============================================================
+  def merge_types(self, types, into=None):
+    """"""
+
+    return None
+
+  #=============================================================
+  def remap_indices(self, indices, remap):
+    """"""
+
+    return indices
+
+  #=============================================================
+  def reset_types(self):
+    """"""
+
+    return
+
+  #=============================================================
+  def update_digest(self, digest):
+    """"""
+
+    digest.update(self.classname.encode('utf-8'))
+    return
+
+  #=============================================================
+  @classmethod
+  def dump_binary(cls, binary_filename, strings, arrays):
+    """"""
+
+    # Lists of strings are stored as StringTables; write under a temporary name so no process sees half a file
+    contents = {'version': np.array(cls._binary_version)}
+    for name, string_list in six.iteritems(strings):
+      table = StringTable.from_strings(string_list)
+      contents[name+'_blob'] = table.blob
+      contents[name+'_offsets'] = table.offsets
+    contents.update(arrays)
+    tmp_filename = '{}.{}.tmp'.format(binary_filename, os.getpid())
+    with open(tmp_filename, 'wb') as f:
+      np.savez(f, **contents)
+    os.rename(tmp_filename, binary_filename)
+    return
+
+  #=============================================================
+  @classmethod
+  def load_binary(cls, binary_filename, text_filename=None):
+    """"""
+
+    # Returns None if the file is missing, from another version, or older than the text file it was made with
+    if not os.path.exists(binary_filename):
+      return None
+    if text_filename and os.path.getmtime(binary_filename) < os.path.getmtime(text_filename):
+      return None
+    with np.load(binary_filename) as binary_file:
+      if int(binary_file['version']) != cls._binary_version:
+        return None
+      contents = {name: binary_file[name] for name in binary_file.files}
+    for name in [name[:-len('_blob')] for name in contents if name.endswith('_blob')]:
+      contents[name] = StringTable(contents.pop(name+'_blob'), contents.pop(name+'_offsets')).tolist()
+    return contents
+
   #=============================================================
   def get_root(self):
     raise NotImplementedError('get_root not implemented for %s' % self.classname)
@@ -104,6 +227,9 @@ class BaseVocab(object):
   def depth(self):
     return self._depth
   @property
+  def positional(self):
+    return self._positional
+  @property
   def classname(self):
     return self.__class__.__name__
 
@@ -145,6 +271,7 @@ class SetVocab(BaseVocab):
     self._idx2str = dict(zip(range(len(special_tokens)), special_tokens))
 
     self._special_tokens = set(special_tokens)
+    self._idx2str_array = None
     return
 
   #=============================================================
@@ -167,6 +294,26 @@ class SetVocab(BaseVocab):
     assert isinstance(token, six.string_types)
     return self[token]
 
+  #=============================================================
+  def encode_batch(self, tokens):
+    """"""
+
+    # Same as add_sequence, but the whole batch is looked up by one map() over the dict
+    if not self.cased:
+      special_tokens = self.special_tokens
+      tokens = [token if token in special_tokens else token.lower() for token in tokens]
+    return list(map(self._str2idx.get, tokens, itertools.repeat(self.UNK_IDX, len(tokens))))
+
+  #=============================================================
+  def decode_batch(self, indices):
+    """"""
+
+    # Same as self[indices] for an array of any shape, but with one fancy-indexing call
+    idx2str = self.idx2str_array
+    indices = np.asarray(indices)
+    indices = np.where((indices >= 0) & (indices < len(idx2str)), indices, self.UNK_IDX)
+    return np.asarray(idx2str[indices], dtype=object).tolist()
+
   #=============================================================
   def get_root(self):
     """"""
@@ -175,6 +322,14 @@ class SetVocab(BaseVocab):
 
   #=============================================================
   @property
+  def idx2str_array(self):
+    # Rebuilt whenever indices have been added since it was last built
+    if self._idx2str_array is None or self._idx2str_array[0] != len(self._idx2str):
+      idx2str = np.full(max(self._idx2str)+1, self.UNK_STR, dtype=object)
+      idx2str[list(self._idx2str.keys())] = list(self._idx2str.values())
+      self._idx2str_array = (len(self._idx2str), idx2str)
+    return self._idx2str_array[1]
+  @property
   def cased(self):
     return self._config.getboolean(self, 'cased')
   @property
@@ -242,6 +397,8 @@ class CountVocab(SetVocab):
 
     super(CountVocab, self).__init__(*args, **kwargs)
     self._counts = Counter()
+    # How an uncased vocab's types are written in the training files, for lookups that need the case
+    self._cased_types = set()
 
   #=============================================================
   def index_by_counts(self, dump=True):
@@ -262,11 +419,50 @@ class CountVocab(SetVocab):
   def dump(self):
     """"""
 
+    sorted_counts = self.sorted()
     with codecs.open(self.vocab_savename, 'w', encoding='utf-8', errors='ignore') as f:
-      for token, count in self.sorted():
+      for token, count in sorted_counts:
         f.write(u'{}\t{}\n'.format(token, count))
+    self.dump_binary_vocab(sorted_counts)
+    return
+
+  #=============================================================
+  def dump_binary_vocab(self, sorted_counts=None):
+    """"""
+
+    # The .lst file stays the human-readable copy; this one has the indices already assigned
+    if sorted_counts is None:
+      sorted_counts = self.sorted()
+    indices, strings = zip(*self._idx2str.items())
+    self.dump_binary(self.binary_savename,
+                     {'tokens': [token for token, _ in sorted_counts],
+                      'strings': strings,
+                      'cased_types': self.cased_types},
+                     {'counts': np.array([count for _, count in sorted_counts], dtype=np.int64),
+                      'indices': np.array(indices, dtype=np.int32),
+                      'settings': np.array(self.binary_settings, dtype=np.int64)})
     return
 
+  #=============================================================
+  def load_binary_vocab(self):
+    """"""
+
+    contents = self.load_binary(self.binary_savename, text_filename=self.vocab_savename)
+    if contents is None or contents['settings'].tolist() != self.binary_settings:
+      return False
+    indices = contents['indices'].tolist()
+    strings = contents['strings']
+    n_special = len(self.special_tokens)
+    if list(zip(indices[:n_special], strings[:n_special])) != [(idx, self._idx2str[idx]) for idx in six.moves.range(n_special)]:
+      return False
+
+    # No parsing or sorting, just bulk dict construction
+    self._counts = Counter(dict(zip(contents['tokens'], contents['counts'].tolist())))
+    self._idx2str = dict(zip(indices, strings))
+    self._str2idx = dict(zip(strings, indices))
+    self._cased_types = set(contents.get('cased_types', []))
+    return True
+
   #=============================================================
   def load(self):
     """"""
@@ -274,6 +470,9 @@ class CountVocab(SetVocab):
     # First check to see if it's saved in the save_dir, then somewhere else
     dump = None
     if os.path.exists(self.vocab_savename):
+      if self.load_binary_vocab():
+        self._loaded = True
+        return True
       vocab_filename = self.vocab_savename
       dump = False
     elif self.vocab_loadname and os.path.exists(self.vocab_loadname):
@@ -292,9 +491,23 @@ class CountVocab(SetVocab):
           count = int(match.group(2))
           self.counts[token] = count
     self.index_by_counts(dump=dump)
+    if not dump:
+      # Saved before there were binary vocabs (or with other settings), so the next load can skip all this
+      self.dump_binary_vocab()
     self._loaded = True
     return True
 
+  #=============================================================
+  def update_digest(self, digest):
+    """"""
+
+    super(CountVocab, self).update_digest(digest)
+    digest.update(str(len(self)).encode('utf-8'))
+    if os.path.exists(self.vocab_savename):
+      with open(self.vocab_savename, 'rb') as f:
+        digest.update(f.read())
+    return
+
   #=============================================================
   # TODO make this a staticmethod
   def sorted(self):
@@ -305,12 +518,22 @@ class CountVocab(SetVocab):
   def vocab_savename(self):
     return os.path.join(self.save_dir, self.field+'-'+self._save_str+'.lst')
   @property
+  def binary_savename(self):
+    return os.path.splitext(self.vocab_savename)[0]+'.npz'
+  @property
+  def binary_settings(self):
+    return [int(self.cased), self.min_occur_count or 0, self.max_embed_count or 0]
+  @property
   def vocab_loadname(self):
     return self._config.getstr(self, 'vocab_loadname')
   @property
   def counts(self):
     return self._counts
   @property
+  def cased_types(self):
+    # Only the ones that differ from a type in the vocab
+    return sorted(token for token in self._cased_types if token != token.lower() and token in self)
+  @property
   def min_occur_count(self):
     return self._config.getint(self, 'min_occur_count')
   @property
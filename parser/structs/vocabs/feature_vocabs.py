@@ -31,6 +31,7 @@ import tensorflow as tf
 
 from parser.structs.vocabs.base_vocabs import BaseVocab
 from . import conllu_vocabs as cv
+from parser.structs.conllu_columns import CoNLLUColumns
 
 from parser.neural import nn, nonlin, embeddings, classifiers
 
@@ -49,6 +50,7 @@ class FeatureVocab(BaseVocab):
     self._counts = DefaultDict(Counter)
     self._str2idx = DefaultDict(dict)
     self._idx2str = DefaultDict(dict)
+    self._multitoken_cache = {}
     self.PAD_STR = self.UNK_STR = self.pad_str
     self.PAD_IDX = self.UNK_IDX = 0
     if self.keyed:
@@ -303,22 +305,23 @@ class FeatureVocab(BaseVocab):
     return len(self._str2idx[feat])
   
   #=============================================================
-  # TODO make this compatible with zipped files
   def count(self, train_conllus):
     """"""
     
-    for train_conllu in train_conllus:
-      with codecs.open(train_conllu, encoding='utf-8', errors='ignore') as f:
-        for line in f:
-          line = line.strip()
-          if line and not line.startswith('#'):
-            line = line.split('\t')
-            multitoken = line[self.conllu_idx] # conllu_idx is provided by the CoNLLUVocab
-            self._count(multitoken)
+    column_counts = CoNLLUColumns.count_columns(train_conllus, [self.conllu_idx]) # conllu_idx is provided by the CoNLLUVocab
+    self.add_counts(column_counts[self.conllu_idx])
     self.index_by_counts()
     return True
   
-  def _count(self, multitoken):
+  #=============================================================
+  def add_counts(self, multitoken_counts):
+    """"""
+    
+    for multitoken, count in six.iteritems(multitoken_counts):
+      self._count(multitoken, count=count)
+    return
+  
+  def _count(self, multitoken, count=1):
     if not self.cased:
       multitoken = multitoken.lower()
     if self.separator:
@@ -337,7 +340,7 @@ class FeatureVocab(BaseVocab):
             self._feats.append(feat)
             self._feat_set.add(feat)
           if token != self.PAD_STR:
-            self._counts[feat][token] += 1
+            self._counts[feat][token] += count
         #if token != self.PAD_STR:
         #  if feat not in self._feat_set:
         #    self._feats.append(feat)
@@ -365,6 +368,47 @@ class FeatureVocab(BaseVocab):
     assert isinstance(multitoken, six.string_types), 'FeatureVocab.index was passed {}'.format(multitoken)
     return self[multitoken]
   
+  #=============================================================
+  def encode_batch(self, multitokens):
+    """"""
+    
+    # Feature strings repeat a lot, so each distinct one only gets split and looked up once
+    cache = self._multitoken_cache
+    indices = []
+    for multitoken in multitokens:
+      index = cache.get(multitoken)
+      if index is None:
+        index = cache[multitoken] = tuple(self.index(multitoken))
+      indices.append(list(index))
+    return indices
+  
+  #=============================================================
+  def decode_batch(self, indices):
+    """"""
+    
+    # Same as self[indices] for an (... x n_feats) array: each feat's strings are
+    # looked up with one fancy-indexing call and then summed into the multitokens
+    indices = np.asarray(indices)
+    separator = self.separator
+    multitokens = np.full(indices.shape[:-1], '', dtype=object)
+    for i in six.moves.range(indices.shape[-1]):
+      feat = self._feats[i] if self.keyed else str(i)
+      idx2str = self._idx2str[feat]
+      strings = np.full(max(idx2str)+1, self.UNK_STR, dtype=object)
+      strings[list(idx2str.keys())] = list(idx2str.values())
+      if self.keyed:
+        strings = np.array([separator+'{}={}'.format(feat, string) for string in strings], dtype=object)
+        # Padded feats are left out
+        strings[self.PAD_IDX] = ''
+      else:
+        strings = np.array([separator+string for string in strings], dtype=object)
+      feat_indices = indices[...,i]
+      feat_indices = np.where((feat_indices >= 0) & (feat_indices < len(strings)), feat_indices, self.UNK_IDX)
+      multitokens += strings[feat_indices]
+    multitokens = np.asarray(np.frompyfunc(lambda multitoken: multitoken[len(separator):], 1, 1)(multitokens), dtype=object)
+    multitokens[np.sum(indices, axis=-1) <= 0] = '_'
+    return multitokens.tolist()
+  
   #=============================================================
   def get_root(self):
     """"""
@@ -391,6 +435,7 @@ class FeatureVocab(BaseVocab):
           cur_idx += 1
     self._str2idx = dict(self._str2idx)
     self._idx2str = dict(self._idx2str)
+    self._multitoken_cache = {}
     self._depth = len(self)
     if self.keyed:
       self._feats.sort()
@@ -414,8 +459,62 @@ class FeatureVocab(BaseVocab):
           for token, count in self.sorted(counter):
             f.write(u'{}\t{}\n'.format(token, count))
           f.write(u'\n')
+    self.dump_binary_vocab()
+    return
+  
+  #=============================================================
+  def dump_binary_vocab(self):
+    """"""
+    
+    # Every feat's strings and counts are concatenated, with offsets marking where each feat starts
+    tokens, counts, count_offsets = [], [], [0]
+    strings, indices, string_offsets = [], [], [0]
+    for feat in self._feats:
+      sorted_counts = self.sorted(self._counts[feat])
+      tokens.extend(token for token, _ in sorted_counts)
+      counts.extend(count for _, count in sorted_counts)
+      count_offsets.append(len(tokens))
+      indices.extend(self._idx2str[feat].keys())
+      strings.extend(self._idx2str[feat].values())
+      string_offsets.append(len(strings))
+    self.dump_binary(self.binary_savename,
+                     {'feats': self._feats,
+                      'tokens': tokens,
+                      'strings': strings,
+                      'pad_str': [self.pad_str]},
+                     {'counts': np.array(counts, dtype=np.int64),
+                      'count_offsets': np.array(count_offsets, dtype=np.int64),
+                      'indices': np.array(indices, dtype=np.int32),
+                      'string_offsets': np.array(string_offsets, dtype=np.int64),
+                      'settings': np.array(self.binary_settings, dtype=np.int64)})
     return
   
+  #=============================================================
+  def load_binary_vocab(self):
+    """"""
+    
+    contents = self.load_binary(self.binary_savename, text_filename=self.vocab_savename)
+    if contents is None or contents['settings'].tolist() != self.binary_settings or contents['pad_str'] != [self.pad_str]:
+      return False
+    
+    # The feats are already in order and every index is already assigned
+    tokens, counts, count_offsets = contents['tokens'], contents['counts'].tolist(), contents['count_offsets'].tolist()
+    strings, indices, string_offsets = contents['strings'], contents['indices'].tolist(), contents['string_offsets'].tolist()
+    str2idx, idx2str = {}, {}
+    for i, feat in enumerate(contents['feats']):
+      start, stop = count_offsets[i], count_offsets[i+1]
+      self._counts[feat] = Counter(dict(zip(tokens[start:stop], counts[start:stop])))
+      start, stop = string_offsets[i], string_offsets[i+1]
+      idx2str[feat] = dict(zip(indices[start:stop], strings[start:stop]))
+      str2idx[feat] = dict(zip(strings[start:stop], indices[start:stop]))
+    self._str2idx = str2idx
+    self._idx2str = idx2str
+    self._multitoken_cache = {}
+    self._feats = contents['feats']
+    self._feat_set = set(self._feats)
+    self._depth = len(self)
+    return True
+  
   #=============================================================
   def load(self):
     """"""
@@ -423,6 +522,9 @@ class FeatureVocab(BaseVocab):
     # First check to see if it's saved in the save_dir, then somewhere else
     dump = None
     if os.path.exists(self.vocab_savename):
+      if self.load_binary_vocab():
+        self._loaded = True
+        return True
       vocab_filename = self.vocab_savename
       dump = False
     elif self.vocab_loadname and os.path.exists(self.vocab_loadname):
@@ -449,9 +551,22 @@ class FeatureVocab(BaseVocab):
             if feat != 'Root':
               self._counts[feat][token] = count
     self.index_by_counts(dump=dump)
+    if not dump:
+      self.dump_binary_vocab()
     self._loaded = True
     return True
   
+  #=============================================================
+  def update_digest(self, digest):
+    """"""
+    
+    super(FeatureVocab, self).update_digest(digest)
+    digest.update(str([self.getlen(feat) for feat in self._feats]).encode('utf-8'))
+    if os.path.exists(self.vocab_savename):
+      with open(self.vocab_savename, 'rb') as f:
+        digest.update(f.read())
+    return
+  
   #=============================================================
   def __getitem__(self, key):
     assert hasattr(key, '__iter__'), 'You gave FeatureVocab.__getitem__ {}'.format(key)
@@ -575,6 +690,12 @@ class FeatureVocab(BaseVocab):
   def vocab_savename(self):
     return os.path.join(self.save_dir, self.field+'-'+self._save_str+'.lst')
   @property
+  def binary_savename(self):
+    return os.path.splitext(self.vocab_savename)[0]+'.npz'
+  @property
+  def binary_settings(self):
+    return [int(self.cased), int(self.keyed), self.min_occur_count or 0, self.max_embed_count or 0]
+  @property
   def keyed(self):
     return self._config.getboolean(self, 'keyed')
   @property
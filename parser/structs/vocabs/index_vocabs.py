@@ -68,6 +68,16 @@ class IndexVocab(BaseVocab):
     else:
       return -1
   
+  #=============================================================
+  def decode_batch(self, indices):
+    """"""
+    
+    # Same as self[indices] for an array of any shape
+    indices = np.asarray(indices)
+    tokens = indices.astype(str).astype(object)
+    tokens[indices < 0] = '_'
+    return tokens.tolist()
+  
   #=============================================================
   def get_root(self):
     """"""
@@ -75,7 +85,7 @@ class IndexVocab(BaseVocab):
     return self.ROOT_STR
   
   #=============================================================
-  def get_bilinear_classifier(self, layer, token_weights, variable_scope=None, reuse=False):
+  def get_bilinear_classifier(self, layer, token_weights, variable_scope=None, reuse=False, attention_mask=None):
     """"""
     
     recur_layer = layer
@@ -107,7 +117,8 @@ class IndexVocab(BaseVocab):
           logits, _ = classifiers.diagonal_bilinear_attention(
             layer1, layer2, 
             hidden_keep_prob=hidden_keep_prob,
-            add_linear=add_linear)
+            add_linear=add_linear,
+            attention_mask=attention_mask)
           if linearize:
             with tf.variable_scope('Linearization'):
               lin_logits = classifiers.diagonal_bilinear_discriminator(
@@ -124,7 +135,8 @@ class IndexVocab(BaseVocab):
           logits, _ = classifiers.bilinear_attention(
             layer1, layer2,
             hidden_keep_prob=hidden_keep_prob,
-            add_linear=add_linear)
+            add_linear=add_linear,
+            attention_mask=attention_mask)
           if linearize:
             with tf.variable_scope('Linearization'):
               lin_logits = classifiers.bilinear_discriminator(
@@ -176,8 +188,13 @@ class IndexVocab(BaseVocab):
         
         #-----------------------------------------------------------
         # Compute probabilities/cross entropy
-        # (n x m) + (m) -> (n x m)
-        non_pads = tf.to_float(token_weights) + tf.to_float(tf.logical_not(tf.cast(tf.range(bucket_size), dtype=tf.bool)))
+        if attention_mask is None:
+          # (n x m) + (m) -> (n x m)
+          non_pads = tf.to_float(token_weights) + tf.to_float(tf.logical_not(tf.cast(tf.range(bucket_size), dtype=tf.bool)))
+        else:
+          # Packed rows have a root at the start of every sentence
+          # (n x m x m) -> (n x m)
+          non_pads = tf.to_float(tf.reduce_any(attention_mask, axis=-2))
         # (n x m x m) o (n x 1 x m) -> (n x m x m)
         probabilities = tf.nn.softmax(logits) * tf.expand_dims(non_pads, -2)
         # (n x m), (n x m x m), (n x m) -> ()
@@ -473,6 +490,12 @@ class GraphIndexVocab(IndexVocab):
     
     return [str(head) for head in index]
   
+  #=============================================================
+  def decode_batch(self, indices):
+    """"""
+    
+    return self[indices]
+  
   #=============================================================
   def get_root(self):
     """"""
@@ -504,6 +527,6 @@ class GraphIndexVocab(IndexVocab):
 class IDIndexVocab(IndexVocab, cv.IDVocab):
   pass
 class DepheadIndexVocab(IndexVocab, cv.DepheadVocab):
-  pass
+  _positional = True
 class SemheadGraphIndexVocab(GraphIndexVocab, cv.SemheadVocab):
   pass
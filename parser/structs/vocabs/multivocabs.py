@@ -19,6 +19,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import six
+
 import numpy as np
 import tensorflow as tf
 
@@ -27,6 +29,7 @@ from . import conllu_vocabs as cv
 from . import token_vocabs as tv
 from . import pretrained_vocabs as pv
 from . import subtoken_vocabs as sv
+from .type_index import TypeIndex
 
 from parser.neural import embeddings
 
@@ -37,6 +40,8 @@ class Multivocab(BaseVocab, list):
   _token_vocab_class = None
   _subtoken_vocab_class = None
   _pretrained_vocab_class = None
+  # How many word types go through the input stack at once when filling the type table
+  _type_batch_size = 4096
   
   #=============================================================
   def __init__(self, config=None):
@@ -82,6 +87,17 @@ class Multivocab(BaseVocab, list):
     self._token_vocab = token_vocab
     self._subtoken_vocab = subtoken_vocab
     self._pretrained_vocabs = pretrained_vocabs
+    if subtoken_vocab is not None:
+      subtoken_vocab.set_token_vocab(token_vocab)
+    
+    # Only used for inference, when the input stack is replaced by a table of word types
+    self._inference = False
+    self._type_layer = None
+    self._type_index = TypeIndex(self.compute_types, cache_size=self.type_cache_size)
+    self._type_session = None
+    self.type_initializer = None
+    self.type_table = None
+    self.extra_type_placeholder = None
     return
   
   #=============================================================
@@ -128,8 +144,68 @@ class Multivocab(BaseVocab, list):
           input_tensors.append(self._token_vocab.get_input_tensor(nonzero_init=nonzero_init, embed_keep_prob=1., variable_scope=variable_scope, reuse=reuse))
       
       layer = self.combine_func(input_tensors, embed_keep_prob=embed_keep_prob, drop_func=self.drop_func)
+      if reuse and self._inference and self.precompute_types:
+        layer = self.get_type_table_tensor(layer)
+    return layer
+  
+  #=============================================================
+  def get_type_table_tensor(self, type_layer):
+    """"""
+    
+    # Every part of the input stack is a function of the word type alone, so once the
+    # weights are fixed it only ever needs to be run on a column of new word types
+    self._type_layer = type_layer[:,0]
+    embed_size = type_layer.get_shape().as_list()[-1]
+    with tf.device('/cpu:0'):
+      # Filled in by build_type_table after the weights are restored, so it's kept out of the checkpoint
+      self.type_initializer = tf.placeholder(tf.float32, [None, embed_size], name='TypeTableInitializer')
+      self.type_table = tf.Variable(self.type_initializer, name='TypeTable', trainable=False, validate_shape=False, collections=[tf.GraphKeys.LOCAL_VARIABLES])
+    # Types that aren't in the table come from the LRU cache, a batch at a time
+    self.extra_type_placeholder = tf.placeholder(tf.float32, [None, embed_size], name='ExtraTypes')
+    params = tf.concat([tf.reshape(self.type_table, [-1, embed_size]), self.extra_type_placeholder], 0)
+    layer = tf.nn.embedding_lookup(params, self.placeholder)
+    layer.set_shape(type_layer.get_shape())
     return layer
   
+  #=============================================================
+  def set_inference(self, inference=True):
+    """"""
+    
+    self._inference = inference
+    return
+  
+  #=============================================================
+  def build_type_table(self, sess):
+    """"""
+    
+    if self.type_table is None:
+      return
+    
+    # The known word types are the token vocab's; everything else goes through the cache
+    self._type_session = sess
+    tokens = []
+    if self._token_vocab is not None:
+      # An uncased token vocab only has lowercased types, but the subtoken keys are the tokens as written,
+      # so every casing of a known type that the training files had (saved with the vocab) gets its own row
+      tokens.extend(self._token_vocab.cased_types)
+      tokens.extend(self._token_vocab[index] for index in sorted(self._token_vocab._idx2str))
+    keys = self._type_index.build(TypeIndex.encode_keys(self, tokens))
+    sess.run(self.type_table.initializer, feed_dict={self.type_initializer: self.compute_types(keys)})
+    return
+  
+  #=============================================================
+  def compute_types(self, keys):
+    """"""
+    
+    embed_size = self.extra_type_placeholder.get_shape().as_list()[-1]
+    type_embeddings = [np.zeros([0, embed_size], dtype=np.float32)]
+    for start in six.moves.range(0, len(keys), self._type_batch_size):
+      feed_dict = {}
+      for vocab, column in zip(self, zip(*keys[start:start+self._type_batch_size])):
+        vocab.set_type_placeholders(column, feed_dict=feed_dict)
+      type_embeddings.append(self._type_session.run(self._type_layer, feed_dict=feed_dict))
+    return np.concatenate(type_embeddings)
+  
   #=============================================================
   def add(self, token):
     """"""
@@ -148,14 +224,86 @@ class Multivocab(BaseVocab, list):
     
     return self[0].token(index)
   
+  #=============================================================
+  def encode_batch(self, tokens):
+    """"""
+    
+    return list(zip(*[vocab.encode_batch(tokens) for vocab in self]))
+  
+  #=============================================================
+  def decode_batch(self, indices):
+    """"""
+    
+    return self[0].decode_batch(indices)
+  
   #=============================================================
   def set_placeholders(self, indices, feed_dict={}):
     """"""
     
+    if self.type_table is not None:
+      # Every token is a word type, which is a row of the type table or one of this batch's extra rows
+      keys, inverse_indices = TypeIndex.get_keys(self, indices)
+      rows, extra_keys = self._type_index.get_rows(keys)
+      feed_dict[self.placeholder] = rows[inverse_indices]
+      feed_dict[self.extra_type_placeholder] = self._type_index.get_extra_types(extra_keys)
+      return feed_dict
+    
     for i, vocab in enumerate(self):
       vocab.set_placeholders(indices[:,:,i], feed_dict=feed_dict)
     return feed_dict
   
+  #=============================================================
+  def encode_sequence(self, tokens, types):
+    """"""
+    
+    return list(zip(*[vocab.encode_sequence(tokens, types) for vocab in self]))
+  
+  #=============================================================
+  def localize_indices(self, indices, types):
+    """"""
+    
+    indices = np.array(indices)
+    for i, vocab in enumerate(self):
+      indices[...,i] = vocab.localize_indices(indices[...,i], types)
+    return indices
+  
+  #=============================================================
+  def merge_types(self, types, into=None):
+    """"""
+    
+    remap = tuple(vocab.merge_types(types, into=into) for vocab in self)
+    if all(vocab_remap is None for vocab_remap in remap):
+      return None
+    return remap
+  
+  #=============================================================
+  def remap_indices(self, indices, remap):
+    """"""
+    
+    if remap is None:
+      return indices
+    indices = np.array(indices)
+    for i, (vocab, vocab_remap) in enumerate(zip(self, remap)):
+      indices[...,i] = vocab.remap_indices(indices[...,i], vocab_remap)
+    return indices
+  
+  #=============================================================
+  def reset_types(self):
+    """"""
+    
+    for vocab in self:
+      vocab.reset_types()
+    return
+  
+  #=============================================================
+  def update_digest(self, digest):
+    """"""
+    
+    super(Multivocab, self).update_digest(digest)
+    for vocab in self:
+      vocab.update_digest(digest)
+    return
+  
   #=============================================================
   def get_root(self):
     """"""
@@ -194,6 +342,12 @@ class Multivocab(BaseVocab, list):
   @property
   def embed_keep_prob(self):
     return self._config.getfloat(self, 'embed_keep_prob')
+  @property
+  def precompute_types(self):
+    return self._config.getboolean(self, 'precompute_types')
+  @property
+  def type_cache_size(self):
+    return self._config.getint(self, 'type_cache_size')
   
 #***************************************************************
 class FormMultivocab(Multivocab, cv.FormVocab):
@@ -21,7 +21,11 @@ from __future__ import print_function
 import six
 
 import os
+import io
 import codecs
+import itertools
+import functools
+import multiprocessing
 import zipfile
 import gzip
 try:
@@ -42,7 +46,9 @@ import numpy as np
 import tensorflow as tf
  
 from parser.structs.vocabs.base_vocabs import SetVocab
+from parser.structs.buckets import StringTable
 from . import conllu_vocabs as cv
+from parser.structs.conllu_columns import CoNLLUColumns
 from parser.neural import embeddings
 
 #***************************************************************
@@ -65,7 +71,15 @@ class PretrainedVocab(SetVocab):
     super(PretrainedVocab, self).__init__(config=config)
     self._pretrained_file = pretrained_file
     self._name = name
-    self.variable = None
+    # Only the rows each batch uses are fed, so the table never gets copied into the session
+    self.rows_placeholder = None
+    # Only used when quantize is set
+    self.scales_placeholder = None
+    self._scales = None
+    self._pruned = False
+    self._full_index = None
+    self._full_embeddings = None
+    self._full_scales = None
     return
   
   #=============================================================
@@ -75,104 +89,410 @@ class PretrainedVocab(SetVocab):
     # Default override
     embed_keep_prob = embed_keep_prob or self.embed_keep_prob
     
+    dtype = tf.int8 if self.quantize else tf.float32
     with tf.variable_scope(variable_scope or self.field):
-      if self.variable is None:
+      if self.rows_placeholder is None:
         with tf.device('/cpu:0'):
-          self.variable = tf.Variable(self.embeddings, name=self.name+'Embeddings', trainable=False)
-          tf.add_to_collection('non_save_variables', self.variable)
-      layer = embeddings.pretrained_embedding_lookup(self.variable, self.linear_size,
+          self.rows_placeholder = tf.placeholder(dtype, [None, self.embed_size], name=self.name+'Rows')
+          if self.quantize:
+            self.scales_placeholder = tf.placeholder(tf.float32, [None, 1], name=self.name+'Scales')
+      layer = embeddings.pretrained_embedding_lookup(self.rows_placeholder, self.linear_size,
                                                      self.placeholder,
                                                      name=self.name,
+                                                     scales=self.scales_placeholder,
                                                      reuse=reuse)
       if embed_keep_prob < 1:
         layer = self.drop_func(layer, embed_keep_prob)
     return layer
+  
+  #=============================================================
+  def set_placeholders(self, indices, feed_dict={}):
+    """"""
+    
+    # The batch only sees the rows it uses, gathered from the memory-mapped store,
+    # so the pages stay shared between every process that maps it
+    indices = np.asarray(indices)
+    rows, local_indices = np.unique(indices, return_inverse=True)
+    if self.quantize and self._scales is not None:
+      # Already int8 on disk, so the rows go straight into the feed
+      feed_dict[self.rows_placeholder] = self.get_rows(rows)
+      feed_dict[self.scales_placeholder] = self.get_rows(rows, scales=True)
+    elif self.quantize:
+      feed_dict[self.rows_placeholder], feed_dict[self.scales_placeholder] = self.quantize_rows(self.get_rows(rows))
+    else:
+      feed_dict[self.rows_placeholder] = np.asarray(self.get_rows(rows), dtype=np.float32)
+    feed_dict[self.placeholder] = local_indices.reshape(indices.shape).astype(np.int32)
+    return feed_dict
+  
+  #=============================================================
+  def get_rows(self, rows, scales=False):
+    """"""
+    
+    # Indices past the (pruned) table point into the full store; rows is sorted, so they come last
+    n_rows = len(self.embeddings)
+    n_table_rows = np.searchsorted(rows, n_rows)
+    table = self._scales if scales else self.embeddings
+    gathered = [np.asarray(table[rows[:n_table_rows]])]
+    if n_table_rows < len(rows):
+      full_table = self.full_scales if scales else self.full_embeddings
+      gathered.append(np.asarray(full_table[rows[n_table_rows:] - n_rows]))
+    return np.concatenate(gathered) if len(gathered) > 1 else gathered[0]
+  
+  #=============================================================
+  @staticmethod
+  def quantize_rows(embeddings):
+    """"""
+    
+    # int8 values with one float scale per row, so that the largest value of each row maps to 127
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    scales = np.max(np.abs(embeddings), axis=1, keepdims=True) / 127
+    scales[scales == 0] = 1
+    return np.round(embeddings / scales).astype(np.int8), scales
+  
+  #=============================================================
+  def add(self, token):
+    """"""
+    
+    index = self.index(token)
+    if index == self.UNK_IDX and self._pruned:
+      row = self.get_full_row(token if self.cased else token.lower())
+      if row is not None:
+        index = len(self.embeddings) + row
+    return index
+  
+  #=============================================================
+  def get_full_row(self, token):
+    """"""
+    
+    tokens, rows = self.full_index
+    i = tokens.searchsorted(token)
+    if i < len(tokens) and tokens[i] == token:
+      return int(rows[i])
+    return None
+  
+  #=============================================================
+  def encode_batch(self, tokens):
+    """"""
+    
+    indices = super(PretrainedVocab, self).encode_batch(tokens)
+    if self._pruned:
+      # Only the unknown tokens need to be looked for in the full store
+      indices = [self.add(token) if index == self.UNK_IDX else index for token, index in zip(tokens, indices)]
+    return indices
     
   #=============================================================
   def count(self, *args):
     """"""
     
     max_embed_count = self.max_embed_count
+    cur_idx = len(self.special_tokens)
+    chunks = self.iterchunks()
+    first_chunk = next(chunks, b'')
+    # A word2vec-style header gives the dimensions
+    first_line = first_chunk[:first_chunk.find(b'\n')+1].split()
+    if len(first_line) == 2:
+      n_rows, embed_size = int(first_line[0]), int(first_line[1])
+      if max_embed_count:
+        n_rows = min(n_rows, max_embed_count)
+      first_chunk = first_chunk[first_chunk.find(b'\n')+1:]
+      embeddings = np.zeros([n_rows+cur_idx, embed_size], dtype=np.float32)
+    else:
+      n_rows, embed_size = None, len(first_line)-1
+      embeddings = [np.zeros([cur_idx, embed_size], dtype=np.float32)]
+    chunks = itertools.chain([first_chunk], chunks)
+    
+    tokens = []
+    pool = multiprocessing.get_context('fork').Pool(self.n_workers) if self.n_workers > 1 else None
+    try:
+      parse_chunk = functools.partial(self.parse_chunk, embed_size=embed_size)
+      if pool is not None:
+        # Hand the workers a few chunks at a time so the whole file is never in memory at once
+        batches = iter(lambda: list(itertools.islice(chunks, 2*self.n_workers)), [])
+        parsed_chunks = itertools.chain.from_iterable(pool.imap(parse_chunk, batch) for batch in batches)
+      else:
+        parsed_chunks = six.moves.map(parse_chunk, chunks)
+      for chunk_tokens, chunk_embeddings in parsed_chunks:
+        if n_rows is not None:
+          n_chunk_tokens = min(len(chunk_tokens), n_rows-len(tokens))
+          embeddings[cur_idx+len(tokens):cur_idx+len(tokens)+n_chunk_tokens] = chunk_embeddings[:n_chunk_tokens]
+        else:
+          n_chunk_tokens = min(len(chunk_tokens), max_embed_count-len(tokens)) if max_embed_count else len(chunk_tokens)
+          embeddings.append(chunk_embeddings[:n_chunk_tokens])
+        tokens.extend(chunk_tokens[:n_chunk_tokens])
+        if len(tokens) == n_rows or (max_embed_count and len(tokens) >= max_embed_count):
+          break
+    finally:
+      if pool is not None:
+        pool.terminate()
+    if n_rows is None:
+      embeddings = np.concatenate(embeddings)
+    else:
+      # The header overcounted
+      embeddings = embeddings[:cur_idx+len(tokens)]
+    
+    self._embed_size = embed_size
+    self._tokens = tokens
+    self._embeddings = embeddings
+    self.dump()
+    if self.pruned_basename:
+      self.prune()
+    self.open_quantized()
+    self.index_tokens()
+    return True
+  
+  #=============================================================
+  def iterchunks(self):
+    """"""
+    
     if self.pretrained_file.endswith('.zip'):
-      open_func = zipfile.Zipfile
-      kwargs = {}
+      def open_func(pretrained_file, mode):
+        archive = zipfile.ZipFile(pretrained_file)
+        return archive.open(archive.namelist()[0])
     elif self.pretrained_file.endswith('.gz'):
       open_func = gzip.open
-      kwargs = {}
     elif self.pretrained_file.endswith('.xz'):
       open_func = lzma.open
-      kwargs = {'errors': 'ignore'}
     else:
-      open_func = codecs.open
-      kwargs = {'errors': 'ignore'}
+      open_func = open
     
-    cur_idx = len(self.special_tokens)
-    tokens = []
-    # Determine the dimensions of the embedding matrix
+    # Read big decompressed chunks and cut them after the last full line
     with open_func(self.pretrained_file, 'rb') as f:
-      reader = codecs.getreader('utf-8')(f, **kwargs)
-      first_line = reader.readline().rstrip().split(' ')
-      if len(first_line) == 2: # It has a header that gives the dimensions
-        has_header = True
-        shape = [int(first_line[0])+cur_idx, int(first_line[1])]
-      else: # We have to compute the dimensions ourself
-        has_header = False
-        for line_num, line in enumerate(reader):
-          pass
-        shape = [cur_idx+line_num+1, len(line.split())-1]
-      shape[0] = min(shape[0], max_embed_count+cur_idx) if max_embed_count else shape[0]
-      embeddings = np.zeros(shape, dtype=np.float32)
-      
-      # Fill in the embedding matrix
-      #with open_func(self.pretrained_file, 'rt', encoding='utf-8') as f:
-      with open_func(self.pretrained_file, 'rb') as f:
-        for line_num, line in enumerate(f):
-          if line_num:
-            if cur_idx < shape[0]:
-              line = line.rstrip()
-              if line:
-                line = line.decode('utf-8', errors='ignore').split(' ')
-                embeddings[cur_idx] = line[1:]
-                tokens.append(line[0])
-                self[line[0]] = cur_idx
-                cur_idx += 1
-            else:
-              break
-    
-    self._embed_size = shape[1]
-    self._tokens = tokens
-    self._embeddings = embeddings
-    self.dump()
-    return True
-
+      carry = b''
+      while True:
+        chunk = f.read(self.chunk_size)
+        if not chunk:
+          if carry.strip():
+            yield carry + b'\n'
+          break
+        carry += chunk
+        split = carry.rfind(b'\n')
+        if split > -1:
+          yield carry[:split+1]
+          carry = carry[split+1:]
+  
+  #=============================================================
+  @staticmethod
+  def parse_chunk(chunk, embed_size):
+    """"""
+    
+    # Lines with exactly embed_size single-space separators go straight to the bulk parser;
+    # anything else is re-split and kept only if it has the right number of fields
+    lines = []
+    for line in chunk.replace(b'\r', b'').split(b'\n'):
+      if line.count(b' ') != embed_size or line.startswith(b' '):
+        line = line.split()
+        if len(line) != embed_size+1:
+          continue
+        line = b' '.join(line)
+      lines.append(line.partition(b' '))
+    tokens = [line[0].decode('utf-8', 'ignore') for line in lines]
+    if not lines:
+      return tokens, np.zeros([0, embed_size], dtype=np.float32)
+    try:
+      embeddings = np.loadtxt(io.BytesIO(b'\n'.join(line[2] for line in lines)), dtype=np.float32, delimiter=' ', comments=None, ndmin=2)
+    except ValueError:
+      # Something loadtxt can't read (e.g. an empty field), so go line by line
+      lines = [line.split() for line in chunk.split(b'\n')]
+      lines = [line for line in lines if len(line) == embed_size+1]
+      tokens = [line[0].decode('utf-8', 'ignore') for line in lines]
+      embeddings = np.array([line[1:] for line in lines], dtype=np.float32).reshape([len(lines), embed_size])
+    return tokens, embeddings
+  
   #=============================================================
   def dump(self):
+    if self.save_as_npy and self.store_basename and not os.path.exists(self.store_basename+'.npy'):
+      self.dump_store(self.store_basename, self._tokens, self._embeddings)
+      # Swap the private copy for shared pages
+      self._tokens, self._embeddings = self.load_store(self.store_basename)
     if self.save_as_pickle and not os.path.exists(self.vocab_loadname):
       os.makedirs(os.path.dirname(self.vocab_loadname), exist_ok=True)
       with open(self.vocab_loadname, 'wb') as f:
-        pkl.dump((self._tokens, self._embeddings), f, protocol=pkl.HIGHEST_PROTOCOL)
+        pkl.dump((self._tokens, np.asarray(self._embeddings)), f, protocol=pkl.HIGHEST_PROTOCOL)
     return
 
   #=============================================================
   def load(self):
     """"""
 
-    if self.vocab_loadname and os.path.exists(self.vocab_loadname):
-      vocab_filename = self.vocab_loadname
+    if self.pruned_basename and os.path.exists(self.pruned_basename+'.npy'):
+      self._tokens, self._embeddings = self.load_store(self.pruned_basename)
+      self._pruned = True
+    elif self.store_basename and os.path.exists(self.store_basename+'.npy'):
+      self._tokens, self._embeddings = self.load_store(self.store_basename)
+    elif self.vocab_loadname and os.path.exists(self.vocab_loadname):
+      with open(self.vocab_loadname, 'rb') as f:
+        self._tokens, self._embeddings = pkl.load(f, encoding='utf-8', errors='ignore')
     else:
       self._loaded = False
       return False
 
-    with open(vocab_filename, 'rb') as f:
-      self._tokens, self._embeddings = pkl.load(f, encoding='utf-8', errors='ignore')
-    cur_idx = len(self.special_tokens)
-    for token in self._tokens:
-      self[token] = cur_idx
-      cur_idx += 1
-    self._embedding_size = self._embeddings.shape[1]
+    if self.pruned_basename and not self._pruned:
+      self.prune()
+    if self._pruned:
+      # Opened here so that forked workers inherit the mappings
+      self.open_full_store()
+    self.open_quantized()
+    self._embed_size = self._embeddings.shape[1]
+    self.index_tokens()
     self._loaded = True
     return True
 
+  #=============================================================
+  def prune(self):
+    """"""
+
+    # Keep the most frequent rows plus every row that the train and dev files use
+    words = set()
+    for conllu_file in self._config.getfiles(self, 'train_conllus') + self._config.getfiles(self, 'dev_conllus'):
+      for block in CoNLLUColumns.iterblocks(conllu_file):
+        column = block.get_column(self.conllu_idx)
+        words.update(column if self.cased else [word.lower() for word in column])
+    cur_idx = len(self.special_tokens)
+    rows = [cur_idx+i for i, token in enumerate(self._tokens)
+            if i < self.prune_head_count or (token if self.cased else token.lower()) in words]
+    tokens = [self._tokens[row-cur_idx] for row in rows]
+    embeddings = np.asarray(self._embeddings[list(six.moves.range(cur_idx)) + rows], dtype=np.float32)
+    self.dump_store(self.pruned_basename, tokens, embeddings)
+    self._tokens, self._embeddings = self.load_store(self.pruned_basename)
+    self._pruned = True
+    return
+
+  #=============================================================
+  def open_full_store(self):
+    """"""
+
+    # Only needed for words that were pruned. Words are looked up by binary search in a sorted
+    # token table saved next to the store, so the store's tokens never get loaded
+    if self.store_basename and os.path.exists(self.store_basename+'.npy'):
+      index_filename = self.full_index_basename+'-rows.npy'
+      if not os.path.exists(index_filename) or os.path.getmtime(index_filename) < os.path.getmtime(self.store_basename+'.npy'):
+        self.dump_full_index()
+      # Plain ndarray views of the mappings, since slicing a np.memmap is several times slower
+      load = lambda suffix: np.asarray(np.load(self.full_index_basename+suffix+'.npy', mmap_mode='r'))
+      self._full_index = (StringTable(load('-blob'), load('-offsets')), load('-rows'))
+      self._full_embeddings, self._full_scales = self.load_matrix(self.store_basename)
+    else:
+      self._full_index = (StringTable.from_strings([]), np.zeros(0, dtype=np.int64))
+    return
+
+  #=============================================================
+  def open_quantized(self):
+    """"""
+
+    # With quantize set, the table in use is swapped for its int8 copy. Otherwise (or if it
+    # was read from a pickle and has no store) each batch's rows are quantized as they're fed
+    basename = self.pruned_basename if self._pruned else self.store_basename
+    if self.quantize and basename and os.path.exists(basename+'.npy'):
+      self._embeddings, self._scales = self.load_matrix(basename)
+    return
+
+  #=============================================================
+  def load_matrix(self, basename):
+    """"""
+
+    # (embeddings, scales), where scales is None unless quantize is set
+    if not self.quantize:
+      return np.load(basename+'.npy', mmap_mode='r'), None
+    quantized_filename = basename+'.int8.npy'
+    if not os.path.exists(quantized_filename) or os.path.getmtime(quantized_filename) < os.path.getmtime(basename+'.npy'):
+      self.dump_quantized(basename)
+    return np.load(quantized_filename, mmap_mode='r'), np.load(basename+'.scales.npy', mmap_mode='r')
+
+  #=============================================================
+  @classmethod
+  def dump_quantized(cls, basename, block_size=65536):
+    """"""
+
+    # Written block by block straight into the new files, so neither the float table
+    # nor the int8 one is ever held in memory; the values go in last, like the store
+    embeddings = np.load(basename+'.npy', mmap_mode='r')
+    tmp_basename = '{}.{}.tmp'.format(basename, os.getpid())
+    values = np.lib.format.open_memmap(tmp_basename+'.int8.npy', mode='w+', dtype=np.int8, shape=embeddings.shape)
+    scales = np.lib.format.open_memmap(tmp_basename+'.scales.npy', mode='w+', dtype=np.float32, shape=(len(embeddings), 1))
+    for start in six.moves.range(0, len(embeddings), block_size):
+      values[start:start+block_size], scales[start:start+block_size] = cls.quantize_rows(embeddings[start:start+block_size])
+    values.flush()
+    scales.flush()
+    del values, scales
+    os.rename(tmp_basename+'.scales.npy', basename+'.scales.npy')
+    os.rename(tmp_basename+'.int8.npy', basename+'.int8.npy')
+    return
+
+  #=============================================================
+  def dump_full_index(self):
+    """"""
+
+    # Sorted by token, keeping the last row of any duplicates like index_tokens does
+    tokens = self.load_store(self.store_basename)[0]
+    if not self.cased:
+      tokens = [token.lower() for token in tokens]
+    order = sorted(six.moves.range(len(tokens)), key=lambda i: (tokens[i], -i))
+    order = [i for j, i in enumerate(order) if not j or tokens[i] != tokens[order[j-1]]]
+    table = StringTable.from_strings([tokens[i] for i in order])
+    rows = np.array(order, dtype=np.int64) + len(self.special_tokens)
+
+    # The rows go in last, so once they exist the whole index does
+    tmp_basename = '{}.{}.tmp'.format(self.full_index_basename, os.getpid())
+    for suffix, array in (('-blob', table.blob), ('-offsets', table.offsets), ('-rows', rows)):
+      np.save(tmp_basename+suffix+'.npy', array)
+    for suffix in ('-blob', '-offsets', '-rows'):
+      os.rename(tmp_basename+suffix+'.npy', self.full_index_basename+suffix+'.npy')
+    return
+
+  #=============================================================
+  @staticmethod
+  def dump_store(basename, tokens, embeddings):
+    """"""
+
+    os.makedirs(os.path.dirname(basename) or '.', exist_ok=True)
+    # Write under temporary names so that concurrent processes never see half a store
+    tmp_basename = '{}.{}.tmp'.format(basename, os.getpid())
+    with codecs.open(tmp_basename+'.tokens', 'w', encoding='utf-8') as f:
+      f.write(u'\n'.join(tokens))
+    np.save(tmp_basename+'.npy', embeddings)
+    os.rename(tmp_basename+'.tokens', basename+'.tokens')
+    os.rename(tmp_basename+'.npy', basename+'.npy')
+    return
+
+  #=============================================================
+  @staticmethod
+  def load_store(basename):
+    """"""
+
+    # The matrix is memory-mapped, so every process on the host shares the same pages
+    with codecs.open(basename+'.tokens', encoding='utf-8') as f:
+      tokens = f.read()
+    tokens = tokens.split(u'\n') if tokens else []
+    return tokens, np.load(basename+'.npy', mmap_mode='r')
+
+  #=============================================================
+  def index_tokens(self):
+    """"""
+
+    # Same as self[token] = idx for every token, but without going through __setitem__ millions of times
+    cur_idx = len(self.special_tokens)
+    indices = six.moves.range(cur_idx, cur_idx+len(self._tokens))
+    tokens = self._tokens if self.cased else [token.lower() for token in self._tokens]
+    self._str2idx.update(zip(tokens, indices))
+    self._idx2str.update(zip(indices, tokens))
+    return
+
+  #=============================================================
+  def update_digest(self, digest):
+    """"""
+
+    # The tables can be huge, so only look at their size and timestamp
+    super(PretrainedVocab, self).update_digest(digest)
+    digest.update(str(len(self)).encode('utf-8'))
+    store_filename = self.store_basename+'.npy' if self.store_basename else None
+    pruned_filename = self.pruned_basename+'.npy' if self.pruned_basename else None
+    for filename in (pruned_filename, store_filename, self.vocab_loadname, self.pretrained_file):
+      if filename and os.path.exists(filename):
+        stat = os.stat(filename)
+        digest.update(u'{} {} {}'.format(filename, stat.st_size, stat.st_mtime).encode('utf-8'))
+        break
+    return
+
   #=============================================================
   @property
   def pretrained_file(self):
@@ -181,6 +501,32 @@ class PretrainedVocab(SetVocab):
   def vocab_loadname(self):
     return self._config.getstr(self, 'vocab_loadname')
   @property
+  def store_basename(self):
+    vocab_loadname = self.vocab_loadname
+    return os.path.splitext(vocab_loadname)[0] if vocab_loadname else None
+  @property
+  def pruned_basename(self):
+    if self.prune_embeddings:
+      return os.path.join(self.save_dir, self.field+'-'+self.name+'.pruned')
+  @property
+  def full_index_basename(self):
+    return self.store_basename+('.index' if self.cased else '.lower-index')
+  @property
+  def full_index(self):
+    if self._full_index is None:
+      self.open_full_store()
+    return self._full_index
+  @property
+  def full_embeddings(self):
+    if self._full_index is None:
+      self.open_full_store()
+    return self._full_embeddings
+  @property
+  def full_scales(self):
+    if self._full_index is None:
+      self.open_full_store()
+    return self._full_scales
+  @property
   def name(self):
     return self._name
   @property
@@ -199,6 +545,24 @@ class PretrainedVocab(SetVocab):
   def save_as_pickle(self):
     return self._config.getboolean(self, 'save_as_pickle')
   @property
+  def save_as_npy(self):
+    return self._config.getboolean(self, 'save_as_npy')
+  @property
+  def prune_embeddings(self):
+    return self._config.getboolean(self, 'prune_embeddings')
+  @property
+  def prune_head_count(self):
+    return self._config.getint(self, 'prune_head_count')
+  @property
+  def quantize(self):
+    return self._config.getboolean(self, 'quantize')
+  @property
+  def n_workers(self):
+    return self._config.getint(self, 'n_workers')
+  @property
+  def chunk_size(self):
+    return self._config.getint(self, 'chunk_size')
+  @property
   def linear_size(self):
     return self._config.getint(self, 'linear_size')
   
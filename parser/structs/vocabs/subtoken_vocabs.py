@@ -31,6 +31,7 @@ import tensorflow as tf
 from parser.structs.buckets import ListMultibucket
 from .base_vocabs import CountVocab
 from . import conllu_vocabs as cv
+from parser.structs.conllu_columns import CoNLLUColumns
 
 from parser.neural import nn, nonlin, embeddings, recurrent, classifiers
 
@@ -48,6 +49,9 @@ class SubtokenVocab(CountVocab):
     self._multibucket = ListMultibucket(self, max_buckets=self.max_buckets, config=config)
     self._tok2idx = {}
     self._idx2tok = {}
+    # Set by the Multivocab when there's a token vocab to gate on
+    self._token_vocab = None
+    self._frequent_tokens = None
     return
 
   #=============================================================
@@ -117,10 +121,17 @@ class SubtokenVocab(CountVocab):
             layer = self.output_func(tf.reduce_sum(layer, axis=-2))
         #layer = tf.tf.Print(layer, [tf.shape(layer)])
         layers.append(layer)
+        if not i and self.gate_count:
+          # Created with the first bucket's variables, before the scope gets reused
+          with tf.variable_scope('Frequent'):
+            frequent_embedding = tf.get_variable('Embedding', shape=[1, layer.get_shape().as_list()[-1]], initializer=tf.zeros_initializer())
       # Concatenate all the buckets' embeddings
       layer = tf.concat(layers, 0)
       # Put them in the right order, creating the embedding matrix
       layer = tf.nn.embedding_lookup(layer, self._multibucket.placeholder)
+      if self.gate_count:
+        # Frequent tokens all share the learned constant in row 0
+        layer = tf.concat([frequent_embedding, layer], 0)
       #layer = tf.nn.embedding_lookup(layers, self._multibucket.placeholder, partition_strategy='div')
       #layer = tf.Print(layer, [tf.shape(layer)])
       # Get the embeddings from the embedding matrix
@@ -134,20 +145,20 @@ class SubtokenVocab(CountVocab):
   def count(self, train_conllus):
     """"""
 
-    tokens = set()
-    for train_conllu in train_conllus:
-      with codecs.open(train_conllu, encoding='utf-8', errors='ignore') as f:
-        for line in f:
-          line = line.strip()
-          if line and not line.startswith('#'):
-            line = line.split('\t')
-            token = line[self.conllu_idx] # conllu_idx is provided by the CoNLLUVocab
-            if token not in tokens:
-              tokens.add(token)
-              self._count(token)
+    column_counts = CoNLLUColumns.count_columns(train_conllus, [self.conllu_idx]) # conllu_idx is provided by the CoNLLUVocab
+    self.add_counts(column_counts[self.conllu_idx])
     self.index_by_counts()
     return True
 
+  #=============================================================
+  def add_counts(self, token_counts):
+    """"""
+
+    # Subtokens are counted once per token type
+    for token in token_counts:
+      self._count(token)
+    return
+
   def _count(self, token):
     if not self.cased:
       token = token.lower()
@@ -170,15 +181,21 @@ class SubtokenVocab(CountVocab):
         self._loaded = False
         return False
 
-      with codecs.open(token_vocab_filename, encoding='utf-8', errors='ignore') as f:
-        for line in f:
-          line = line.rstrip()
-          if line:
-            match = re.match('(.*)\s([0-9]*)', line)
-            token = match.group(1)
-            count = int(match.group(2))
-            self._count(token)
-            self._count(token.upper())
+      # Only the token strings are needed, so take them from the binary token vocab if there is one
+      contents = self.load_binary(os.path.splitext(token_vocab_filename)[0]+'.npz', text_filename=token_vocab_filename)
+      if contents is not None:
+        tokens = contents['tokens']
+      else:
+        tokens = []
+        with codecs.open(token_vocab_filename, encoding='utf-8', errors='ignore') as f:
+          for line in f:
+            line = line.rstrip()
+            if line:
+              match = re.match('(.*)\s([0-9]*)', line)
+              tokens.append(match.group(1))
+      for token in tokens:
+        self._count(token)
+        self._count(token.upper())
       self.index_by_counts(dump=True)
       self._loaded = True
       return True
@@ -206,12 +223,143 @@ class SubtokenVocab(CountVocab):
 
     return self._tok2idx[token]
 
+  #=============================================================
+  def encode_batch(self, tokens):
+    """"""
+
+    # Every new token gets added to self._multibucket, so this can't be a dict lookup
+    return self.add_sequence(tokens)
+
+  #=============================================================
+  def encode_type_keys(self, tokens):
+    """"""
+
+    return list(tokens)
+
+  #=============================================================
+  def get_type_keys(self, indices):
+    """"""
+
+    return [self._idx2tok.get(index, '') for index in np.asarray(indices).tolist()]
+
+  #=============================================================
+  def set_type_placeholders(self, tokens, feed_dict={}):
+    """"""
+
+    rows = np.arange(len(tokens), dtype=np.int32)
+    if self.gate_count:
+      is_frequent = self.is_frequent(tokens)
+      tokens = [token for token, frequent in zip(tokens, is_frequent) if not frequent]
+      rows = self.get_gated_rows(is_frequent)
+
+    # Same character indices as add, but fed straight into the first bucket so that
+    # self._multibucket (which belongs to whatever dataset is open) is left alone
+    sequences = [[self._str2idx.get(character, self.UNK_IDX) for character in list(token)[:50]] for token in tokens]
+    data = np.zeros([max(1, len(sequences)), max([1] + [len(sequence) for sequence in sequences])], dtype=np.int32)
+    for i, sequence in enumerate(sequences):
+      data[i, :len(sequence)] = sequence
+    for i, placeholder in enumerate(self._multibucket.get_placeholders()):
+      feed_dict[placeholder] = data if not i else np.zeros([1, 1], dtype=np.int32)
+    feed_dict[self._multibucket.placeholder] = np.arange(len(sequences), dtype=np.int32)
+    feed_dict[self.placeholder] = rows[:,None]
+    return feed_dict
+
+  #=============================================================
+  def set_token_vocab(self, token_vocab):
+    """"""
+
+    self._token_vocab = token_vocab
+    self._frequent_tokens = None
+    return
+
+  #=============================================================
+  def is_frequent(self, tokens):
+    """"""
+
+    # Frequent means the token vocab has its own embedding for it, learned from at least gate_count occurrences
+    if self._frequent_tokens is None:
+      if self._token_vocab is None:
+        self._frequent_tokens = set()
+      else:
+        gate_count = self.gate_count
+        self._frequent_tokens = set(token for token, count in six.iteritems(self._token_vocab.counts) if count >= gate_count and token in self._token_vocab)
+    if self._token_vocab is not None and not self._token_vocab.cased:
+      tokens = [token.lower() for token in tokens]
+    frequent_tokens = self._frequent_tokens
+    return np.array([token in frequent_tokens for token in tokens], dtype=bool)
+
+  #=============================================================
+  @staticmethod
+  def get_gated_rows(is_frequent):
+    """"""
+
+    # Row 0 is the learned constant, and the rest follow the tokens that go through the character model
+    rows = np.zeros(len(is_frequent), dtype=np.int32)
+    rows[~is_frequent] = np.arange(1, np.sum(~is_frequent)+1, dtype=np.int32)
+    return rows
+
+  #=============================================================
+  def encode_sequence(self, tokens, types):
+    """"""
+
+    # Leaves self._multibucket alone; the types get merged in with merge_types
+    local_types = types.setdefault(self.classname, {})
+    return [local_types.setdefault(token, len(local_types)) for token in tokens]
+
+  #=============================================================
+  def localize_indices(self, indices, types):
+    """"""
+
+    # Token indices point into self._multibucket, which is shared by every dataset,
+    # so rewrite them as indices into a table of types that can be merged back in later
+    local_types = types.setdefault(self.classname, {})
+    unique_indices, inverse_indices = np.unique(indices, return_inverse=True)
+    local_indices = np.array([local_types.setdefault(self._idx2tok.get(index, ''), len(local_types)) for index in unique_indices], dtype=np.int32)
+    return local_indices[inverse_indices].reshape(np.shape(indices))
+
+  #=============================================================
+  def merge_types(self, types, into=None):
+    """"""
+
+    local_types = types.get(self.classname)
+    if not local_types:
+      return None
+    tokens = sorted(local_types, key=local_types.get)
+    if into is None:
+      return np.array([self.add(token) for token in tokens], dtype=np.int32)
+    
+    # Merge into another table of local types instead of self._multibucket;
+    # '' comes first so that padding keeps pointing at the empty subtoken sequence
+    into_types = into.setdefault(self.classname, {'': 0})
+    return np.array([into_types.setdefault(token, len(into_types)) for token in tokens], dtype=np.int32)
+
+  #=============================================================
+  def remap_indices(self, indices, remap):
+    """"""
+
+    if remap is None:
+      return indices
+    return remap[indices]
+
+  #=============================================================
+  def reset_types(self):
+    """"""
+
+    self.reset()
+    return
+
   #=============================================================
   def set_placeholders(self, indices, feed_dict={}):
     """"""
 
     unique_indices, inverse_indices = np.unique(indices, return_inverse=True)
-    feed_dict[self.placeholder] = inverse_indices.reshape(indices.shape)
+    inverse_indices = inverse_indices.reshape(indices.shape)
+    if self.gate_count:
+      # Only the rare tokens are run through the character model
+      is_frequent = self.is_frequent([self._idx2tok.get(index, '') for index in unique_indices.tolist()])
+      inverse_indices = self.get_gated_rows(is_frequent)[inverse_indices]
+      unique_indices = unique_indices[~is_frequent]
+    feed_dict[self.placeholder] = inverse_indices
     self._multibucket.set_placeholders(unique_indices, feed_dict=feed_dict)
     return feed_dict
 
@@ -248,6 +396,9 @@ class SubtokenVocab(CountVocab):
   def max_buckets(self):
     return self._config.getint(self, 'max_buckets')
   @property
+  def gate_count(self):
+    return self._config.getint(self, 'gate_count')
+  @property
   def embed_keep_prob(self):
     return self._config.getfloat(self, 'embed_keep_prob')
   @property
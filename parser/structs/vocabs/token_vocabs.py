@@ -29,6 +29,7 @@ import tensorflow as tf
 
 from parser.structs.vocabs.base_vocabs import CountVocab
 from . import conllu_vocabs as cv
+from parser.structs.conllu_columns import CoNLLUColumns
 
 from parser.neural import nn, nonlin, embeddings, classifiers
 
@@ -43,6 +44,15 @@ class TokenVocab(CountVocab):
     """"""
     
     super(TokenVocab, self).__init__(*args, **kwargs)
+    self._inference = False
+    self.heads_placeholder = None
+    return
+  
+  #=============================================================
+  def set_inference(self, inference=True):
+    """"""
+    
+    self._inference = inference
     return
   
   #=============================================================
@@ -236,7 +246,7 @@ class TokenVocab(CountVocab):
     return outputs
     
   #=============================================================
-  def get_bilinear_classifier(self, layer, outputs, token_weights, variable_scope=None, reuse=False):
+  def get_bilinear_classifier(self, layer, outputs, token_weights, variable_scope=None, reuse=False, attention_mask=None):
     """"""
     
     layer1 = layer2 = layer
@@ -261,12 +271,14 @@ class TokenVocab(CountVocab):
           logits = classifiers.diagonal_bilinear_classifier(
             layer1, layer2, len(self),
             hidden_keep_prob=hidden_keep_prob,
-            add_linear=add_linear)
+            add_linear=add_linear,
+            attention_mask=attention_mask)
         else:
           logits = classifiers.bilinear_classifier(
             layer1, layer2, len(self),
             hidden_keep_prob=hidden_keep_prob,
-            add_linear=add_linear)
+            add_linear=add_linear,
+            attention_mask=attention_mask)
         bucket_size = tf.shape(layer)[-2]
         
         #-------------------------------------------------------
@@ -321,11 +333,36 @@ class TokenVocab(CountVocab):
         # (n), (n) -> (n)
         correct_label_sequences = nn.equal(tokens_per_sequence, correct_label_tokens_per_sequence)
         correct_sequences = nn.equal(tokens_per_sequence, correct_tokens_per_sequence)
+        
+        #-------------------------------------------------------
+        # When parsing, the trees can be decoded from the head probabilities
+        # first and fed back in, so labels only get scored for those heads
+        if reuse and self._inference and self.select_heads:
+          # (n x m)
+          self.heads_placeholder = tf.placeholder(tf.int32, [None, None], name=self.classname+'-heads')
+          with tf.variable_scope(tf.get_variable_scope(), reuse=True):
+            if self.diagonal:
+              selected_logits = classifiers.diagonal_bilinear_classifier_cond(
+                layer1, layer2, len(self), self.heads_placeholder,
+                hidden_keep_prob=hidden_keep_prob,
+                add_linear=add_linear)
+            else:
+              selected_logits = classifiers.bilinear_classifier_cond(
+                layer1, layer2, len(self), self.heads_placeholder,
+                hidden_keep_prob=hidden_keep_prob,
+                add_linear=add_linear)
+          # (n x m x c) -> (n x m)
+          selected_label_predictions = tf.argmax(selected_logits, axis=-1, output_type=tf.int32)
     
     #-----------------------------------------------------------
     # Populate the output dictionary
     rho = self.loss_interpolation
     outputs['label_targets'] = label_targets
+    if reuse and self._inference and self.select_heads:
+      # (n x m x m)
+      outputs['head_probabilities'] = outputs['probabilities']
+      outputs['heads_placeholder'] = self.heads_placeholder
+      outputs['selected_label_predictions'] = selected_label_predictions
     # This way we can reconstruct the head_probabilities by exponentiating and summing along the last axis
     outputs['probabilities'] = label_probabilities * head_probabilities
     outputs['label_loss'] = label_loss
@@ -394,7 +431,7 @@ class TokenVocab(CountVocab):
     return outputs
 
   #=============================================================
-  def get_unfactored_bilinear_classifier(self, layer, unlabeled_targets, token_weights, variable_scope=None, reuse=False):
+  def get_unfactored_bilinear_classifier(self, layer, unlabeled_targets, token_weights, variable_scope=None, reuse=False, attention_mask=None):
     """"""
     
     recur_layer = layer
@@ -419,12 +456,14 @@ class TokenVocab(CountVocab):
           logits = classifiers.diagonal_bilinear_classifier(
             layer1, layer2, len(self),
             hidden_keep_prob=hidden_keep_prob,
-            add_linear=add_linear)
+            add_linear=add_linear,
+            attention_mask=attention_mask)
         else:
           logits = classifiers.bilinear_classifier(
             layer1, layer2, len(self),
             hidden_keep_prob=hidden_keep_prob,
-            add_linear=add_linear)
+            add_linear=add_linear,
+            attention_mask=attention_mask)
         bucket_size = tf.shape(layer)[-2]
         
         #-------------------------------------------------------
@@ -487,25 +526,28 @@ class TokenVocab(CountVocab):
     return outputs
   
   #=============================================================
-  # TODO make this compatible with zipped files
   def count(self, train_conllus):
     """"""
     
-    for train_conllu in train_conllus:
-      with codecs.open(train_conllu, encoding='utf-8', errors='ignore') as f:
-        for line in f:
-          line = line.strip()
-          if line and not line.startswith('#'):
-            line = line.split('\t')
-            token = line[self.conllu_idx] # conllu_idx is provided by the CoNLLUVocab
-            self._count(token)
+    column_counts = CoNLLUColumns.count_columns(train_conllus, [self.conllu_idx]) # conllu_idx is provided by the CoNLLUVocab
+    self.add_counts(column_counts[self.conllu_idx])
     self.index_by_counts()
     return True
   
-  def _count(self, token):
+  #=============================================================
+  def add_counts(self, token_counts):
+    """"""
+    
+    for token, count in six.iteritems(token_counts):
+      self._count(token, count=count)
+    if not self.cased:
+      self._cased_types.update(token_counts)
+    return
+  
+  def _count(self, token, count=1):
     if not self.cased:
       token = token.lower()
-    self.counts[token] += 1
+    self.counts[token] += count
     return
   
   #=============================================================
@@ -535,6 +577,9 @@ class TokenVocab(CountVocab):
   def factorized(self):
     return self._config.getboolean(self, 'factorized')
   @property
+  def select_heads(self):
+    return self._config.getboolean(self, 'select_heads')
+  @property
   def hidden_size(self):
     return self._config.getint(self, 'hidden_size')
   @property
@@ -841,13 +886,13 @@ class GraphTokenVocab(TokenVocab):
     return outputs
     
   #=============================================================
-  def _count(self, node):
+  def _count(self, node, count=1):
     if node not in ('_', ''):
       node = node.split('|')
       for edge in node:
         edge = edge.split(':', 1)
         head, rel = edge
-        self.counts[rel] += 1
+        self.counts[rel] += count
     return
   
   #=============================================================
@@ -869,6 +914,19 @@ class GraphTokenVocab(TokenVocab):
         nodes.append( (int(head), super(GraphTokenVocab, self).__getitem__(semrel)) )
     return nodes
   
+  #=============================================================
+  def encode_batch(self, tokens):
+    """"""
+    
+    # Every token is a list of edges, so there's nothing to vectorize
+    return self.add_sequence(tokens)
+  
+  #=============================================================
+  def decode_batch(self, indices):
+    """"""
+    
+    return self[indices]
+  
   #=============================================================
   # index should be [(1, 12), (2, 4), (5, 2)]
   def token(self, index):
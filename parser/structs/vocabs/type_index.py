@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Copyright 2017 Timothy Dozat
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import six
+
+from collections import OrderedDict
+
+import numpy as np
+
+#***************************************************************
+# Which row of an inference-time type table each word type is. Known types
+# have fixed rows; the rest are computed per batch and kept in an LRU cache.
+# Nothing in here needs tensorflow, so it can be tested on its own
+class TypeIndex(object):
+  """"""
+
+  #=============================================================
+  def __init__(self, compute_types, cache_size=0):
+    """"""
+
+    # compute_types maps a list of keys to a [len(keys), embed_size] array
+    self._compute_types = compute_types
+    self._cache_size = cache_size
+    self._rows = {}
+    self._cache = OrderedDict()
+    return
+
+  #=============================================================
+  @staticmethod
+  def encode_keys(vocabs, tokens):
+    """"""
+
+    # A key is a tuple with one part per vocab
+    return list(zip(*[vocab.encode_type_keys(tokens) for vocab in vocabs]))
+
+  #=============================================================
+  @staticmethod
+  def get_keys(vocabs, indices):
+    """"""
+
+    # The last axis of indices has one index per vocab; returns each distinct type's key
+    # and, for every position, which of those keys it has
+    indices = np.asarray(indices)
+    unique_indices, inverse_indices = np.unique(indices.reshape([-1, len(vocabs)]), axis=0, return_inverse=True)
+    keys = list(zip(*[vocab.get_type_keys(unique_indices[:,i]) for i, vocab in enumerate(vocabs)]))
+    return keys, inverse_indices.reshape(indices.shape[:-1])
+
+  #=============================================================
+  def build(self, keys):
+    """"""
+
+    # Rows go in the order the keys are first seen; returns the keys in row order
+    keys = list(OrderedDict.fromkeys(keys))
+    self._rows = dict(zip(keys, six.moves.range(len(keys))))
+    self._cache.clear()
+    return keys
+
+  #=============================================================
+  def get_rows(self, keys):
+    """"""
+
+    # Unknown keys get the rows after the table, in order; returns the rows and the unknown keys
+    rows = np.zeros(len(keys), dtype=np.int32)
+    n_rows = len(self._rows)
+    extra_keys = []
+    for i, key in enumerate(keys):
+      row = self._rows.get(key)
+      if row is None:
+        row = n_rows + len(extra_keys)
+        extra_keys.append(key)
+      rows[i] = row
+    return rows, extra_keys
+
+  #=============================================================
+  def get_extra_types(self, keys):
+    """"""
+
+    # Only types that have never been seen (or have fallen out of the cache) get computed
+    cache = self._cache
+    new_keys = [key for key in keys if key not in cache]
+    new_types = dict(zip(new_keys, self._compute_types(new_keys)))
+    extra_types = []
+    for key in keys:
+      if key in new_types:
+        cache[key] = new_types[key]
+      else:
+        cache.move_to_end(key)
+      extra_types.append(cache[key])
+    while len(cache) > self._cache_size:
+      cache.popitem(last=False)
+    if extra_types:
+      return np.stack(extra_types)
+    return self._compute_types([])
+
+  #=============================================================
+  @property
+  def rows(self):
+    return self._rows
+  @property
+  def cache(self):
+    return self._cache
+
+  #=============================================================
+  def __len__(self):
+    return len(self._rows)
+  def __contains__(self, key):
+    return key in self._rows
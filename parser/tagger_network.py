@@ -57,6 +57,14 @@ class TaggerNetwork(BaseNetwork):
     n_tokens = tf.reduce_sum(tokens_per_sequence)
     n_sequences = tf.count_nonzero(tokens_per_sequence)
     seq_lengths = tokens_per_sequence + 1
+    if self.pack_sentences:
+      # Rows may hold several sentences, each with its own root
+      # (n x m) -> (n x m)
+      segment_ids = nn.segment_ids(self.id_vocab.placeholder)
+      # (n x m) -> (n)
+      seq_lengths = tf.count_nonzero(segment_ids, axis=1, dtype=tf.int32)
+    else:
+      segment_ids = None
     tokens = {'n_tokens': n_tokens,
               'tokens_per_sequence': tokens_per_sequence,
               'token_weights': token_weights,
@@ -80,7 +88,8 @@ class TaggerNetwork(BaseNetwork):
                                           cifg=self.cifg,
                                           highway=self.highway,
                                           highway_func=self.highway_func,
-                                          bilin=self.bilin)
+                                          bilin=self.bilin,
+                                          segment_ids=segment_ids)
     
     output_vocabs = {vocab.field: vocab for vocab in self.output_vocabs}
     outputs = {}
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Copyright 2017 Timothy Dozat
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import time
+
+from parser.structs.conllu_dataset import CoNLLUDataset
+from parser.structs.conllu_columns import CoNLLUColumns
+
+# Every vocab extracts one column per sentence, so time that too
+conllu_idxs = list(range(CoNLLUColumns.n_columns))
+
+#***************************************************************
+def line_reader(conllu_file):
+  """"""
+
+  n_sents = n_tokens = 0
+  for sent in CoNLLUDataset.itersents(conllu_file):
+    for conllu_idx in conllu_idxs:
+      tokens = [line[conllu_idx] for line in sent]
+    n_sents += 1
+    n_tokens += len(sent)
+  return n_sents, n_tokens
+
+#***************************************************************
+def column_reader(conllu_file):
+  """"""
+
+  n_sents = n_tokens = 0
+  for sent in CoNLLUColumns.itersents(conllu_file):
+    for conllu_idx in conllu_idxs:
+      tokens = sent.column(conllu_idx)
+    n_sents += 1
+    n_tokens += len(sent)
+  return n_sents, n_tokens
+
+#***************************************************************
+def main(conllu_files, n_repeats=3):
+  """"""
+
+  for conllu_file in conllu_files:
+    print(conllu_file)
+    for name, reader in (('line', line_reader), ('column', column_reader)):
+      best = float('inf')
+      for _ in range(n_repeats):
+        start_time = time.time()
+        n_sents, n_tokens = reader(conllu_file)
+        best = min(best, time.time() - start_time)
+      # The line reader also yields an empty trailing sentence
+      print('  {:6s} {:8d} sents {:10d} tokens {:8.3f}s {:12.0f} tokens/s'.format(name, n_sents, n_tokens, best, n_tokens / best))
+  return
+
+if __name__ == '__main__':
+  """"""
+
+  main(sys.argv[1:])
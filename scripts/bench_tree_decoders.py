@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Copyright 2017 Timothy Dozat
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from scripts.chuliu_edmonds import chuliu_edmonds_one_root, mst_one_root
+from scripts.eisner import eisner
+
+#***************************************************************
+def make_bucket(batch_size, bucket_size, sharpness, random):
+  """"""
+
+  # Lengths spread over the bucket like they would be after bucketing; lengths include the root
+  lengths = random.randint(max(bucket_size//2, 2), bucket_size+1, size=batch_size)
+  lengths[0] = bucket_size
+  logits = random.randn(batch_size, bucket_size, bucket_size) * sharpness
+  probs = np.exp(logits - logits.max(axis=-1, keepdims=True))
+  probs /= probs.sum(axis=-1, keepdims=True)
+  return probs, lengths
+
+#***************************************************************
+def decode_sentences(tree_decoder):
+  """"""
+
+  # The same loop as GraphOutputs.probs_to_preds
+  def decode(probs, lengths):
+    preds = np.zeros(probs.shape[:2], dtype=np.int32)
+    for i, (_probs, length) in enumerate(zip(probs, lengths)):
+      preds[i, :length] = tree_decoder(_probs[:length, :length])
+    return preds
+  return decode
+
+#***************************************************************
+def main():
+  """"""
+
+  argparser = ArgumentParser('Time the tree decoders GraphOutputs can use on random buckets')
+  argparser.add_argument('--bucket_sizes', type=int, nargs='+', default=[10, 20, 40, 80, 160])
+  argparser.add_argument('--batch_size', type=int, default=64)
+  argparser.add_argument('--sharpness', type=float, default=3)
+  argparser.add_argument('--n_repeats', type=int, default=3)
+  argparser.add_argument('--chuliu_edmonds', action='store_true', help='Also time the old recursive decoder')
+  args = argparser.parse_args()
+
+  decoders = [('mst', decode_sentences(mst_one_root)),
+              ('eisner', eisner)]
+  if args.chuliu_edmonds:
+    decoders.append(('chuliu_edmonds', decode_sentences(chuliu_edmonds_one_root)))
+  random = np.random.RandomState(0)
+  print('{:>6s} {:16s} {:>10s} {:>12s}'.format('Bucket', 'Decoder', 'ms/sent', 'sents/s'))
+  for bucket_size in args.bucket_sizes:
+    probs, lengths = make_bucket(args.batch_size, bucket_size, args.sharpness, random)
+    for name, decode in decoders:
+      best = float('inf')
+      for _ in range(args.n_repeats):
+        start_time = time.time()
+        decode(probs, lengths)
+        best = min(best, time.time() - start_time)
+      print('{:6d} {:16s} {:10.3f} {:12.0f}'.format(bucket_size, name, 1000 * best / len(lengths), len(lengths) / best))
+  return
+
+if __name__ == '__main__':
+  """"""
+
+  main()
@@ -170,6 +170,148 @@ def chuliu_edmonds_one_root(scores):
     raise
   return best_tree
   
+#===============================================================
+def mst(scores):
+  """"""
+  
+  # Iterative Chu-Liu-Edmonds in the style of Tarjan (1977): nodes pick their
+  # best head one at a time, and a cycle is contracted into a new node as
+  # soon as it closes. Contracted nodes get their own row and column, so with
+  # dense scores every step is O(n) and the whole thing is O(n^2).
+  # scores[dep, head] are log scores; node 0 is the root and never gets a head.
+  n = len(scores)
+  n_nodes = 2*n - 1
+  S = np.full((n_nodes, n_nodes), -np.inf)
+  S[:n,:n] = scores
+  S[np.arange(n), np.arange(n)] = -np.inf
+  S[0] = -np.inf
+  # The original dependent and head of the edge each entry of S stands for
+  orig_dep = np.zeros((n_nodes, n_nodes), dtype=np.int32)
+  orig_head = np.zeros((n_nodes, n_nodes), dtype=np.int32)
+  orig_dep[:n,:n] = np.arange(n)[:,None]
+  orig_head[:n,:n] = np.arange(n)[None,:]
+  
+  # parent is the contraction forest; top is the same with compressed paths
+  parent = -np.ones(n_nodes, dtype=np.int32)
+  top = -np.ones(n_nodes, dtype=np.int32)
+  children = {}
+  in_head = -np.ones(n_nodes, dtype=np.int32)
+  in_score = np.zeros(n_nodes)
+  in_dep = np.zeros(n_nodes, dtype=np.int32)
+  in_orig_head = np.zeros(n_nodes, dtype=np.int32)
+  #-------------------------------------------------------------
+  def find(node):
+    root = node
+    while top[root] != -1:
+      root = top[root]
+    while top[node] != -1:
+      top[node], node = root, top[node]
+    return root
+  #-------------------------------------------------------------
+  
+  n_contracted = n
+  queue = list(range(n-1, 0, -1))
+  while queue:
+    node = queue.pop()
+    head = int(np.argmax(S[node]))
+    in_head[node] = head
+    in_score[node] = S[node, head]
+    in_dep[node] = orig_dep[node, head]
+    in_orig_head[node] = orig_head[node, head]
+    
+    # Follow the heads up from the new one; coming back to node means there's a cycle
+    cycle = [node]
+    ancestor = head
+    while ancestor != node and in_head[ancestor] != -1:
+      cycle.append(ancestor)
+      ancestor = find(in_head[ancestor])
+    if ancestor != node:
+      continue
+    
+    # Contract the cycle; an edge into it replaces the cycle edge into its dependent
+    contracted = n_contracted
+    n_contracted += 1
+    cycle = np.array(cycle)
+    range_ = np.arange(n_nodes)
+    heads = S[cycle] - in_score[cycle,None]
+    best = np.argmax(heads, axis=0)
+    S[contracted] = heads[best, range_]
+    orig_dep[contracted] = orig_dep[cycle[best], range_]
+    orig_head[contracted] = orig_head[cycle[best], range_]
+    deps = S[:,cycle]
+    best = np.argmax(deps, axis=1)
+    S[:,contracted] = deps[range_, best]
+    orig_dep[:,contracted] = orig_dep[range_, cycle[best]]
+    orig_head[:,contracted] = orig_head[range_, cycle[best]]
+    S[:,cycle] = -np.inf
+    S[cycle] = -np.inf
+    S[contracted, contracted] = -np.inf
+    parent[cycle] = contracted
+    top[cycle] = contracted
+    children[contracted] = cycle
+    queue.append(contracted)
+  
+  # Expand the contracted nodes from the top down: the edge into a contracted
+  # node breaks the cycle at its dependent, and the rest of the cycle stays
+  tree = -np.ones(n, dtype=np.int32)
+  stack = [node for node in range(1, n_contracted) if parent[node] == -1]
+  while stack:
+    node = stack.pop()
+    dep = in_dep[node]
+    tree[dep] = in_orig_head[node]
+    while dep != node:
+      contracted = parent[dep]
+      stack.extend(child for child in children[contracted] if child != dep)
+      dep = contracted
+  return tree
+
+#===============================================================
+def mst_one_root(scores):
+  """"""
+  
+  # Penalize every edge from the root by more than all the other edges can
+  # make up for, so the best tree is the best one with a single root edge.
+  # This takes one pass instead of one pass for every candidate root.
+  scores = np.log(np.maximum(scores.astype(np.float64), np.finfo(np.float64).tiny))
+  if len(scores) > 1:
+    edges = scores[1:]
+    penalty = len(scores) * (edges.max() - edges.min()) + 1
+    scores[1:,0] -= penalty
+  tree = mst(scores)
+  tree[0] = 0
+  return tree
+
+#***************************************************************
+def tree_score(scores, tree):
+  """"""
+  
+  return np.log(np.maximum(scores[np.arange(1, len(tree)), tree[1:]], np.finfo(np.float64).tiny)).sum()
+
+#***************************************************************
+def fuzz(n_trials=1000, max_len=40, seed=0):
+  """"""
+  
+  # The old decoder only tries the roots the unconstrained tree picked, so
+  # it can miss the best single-root tree; the new one should never do worse
+  random = np.random.RandomState(seed)
+  n_same = n_better = 0
+  for i in range(n_trials):
+    n = random.randint(2, max_len+1)
+    scores = np.exp(random.randn(n,n) * random.choice([.5, 2, 5]))
+    scores /= scores.sum(axis=1, keepdims=True)
+    scores *= (1-np.eye(n))
+    old_tree = chuliu_edmonds_one_root(scores)
+    new_tree = mst_one_root(scores)
+    assert not tarjan(new_tree), new_tree
+    assert np.sum(np.equal(new_tree[1:], 0)) == 1, new_tree
+    old_score = tree_score(scores, old_tree)
+    new_score = tree_score(scores, new_tree)
+    assert new_score >= old_score - 1e-8 * abs(old_score), (scores, old_tree, new_tree)
+    n_same += np.all(old_tree[1:] == new_tree[1:])
+    n_better += new_score > old_score + 1e-8 * abs(old_score)
+  print('{} random trees: {} the same as chuliu_edmonds_one_root, {} with a better score'.format(n_trials, n_same, n_better))
+  return
+
 #***************************************************************
 def main(n=10):
   """"""
@@ -184,6 +326,7 @@ def main(n=10):
     print(newtree, cycles, roots)
     assert not cycles
     assert len(roots) == 1
+  fuzz()
   return
 
 #***************************************************************
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Copyright 2017 Timothy Dozat
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import re
+import sys
+import subprocess
+from argparse import ArgumentParser
+
+import scripts.conll18_ud_eval as ud_eval
+
+metrics = ('UPOS', 'XPOS', 'UFeats', 'Lemmas', 'UAS', 'LAS')
+
+#***************************************************************
+def parse(save_dir, conllu_file, output_dir, output_filename):
+  """"""
+
+  # parse_file reports how long the parse itself took, without the graph building and restoring
+  command = [sys.executable, 'main.py', '--save_dir', save_dir,
+             'run', conllu_file,
+             '--output_dir', output_dir,
+             '--output_filename', output_filename]
+  output = subprocess.check_output(command).decode('utf-8', 'ignore')
+  sys.stdout.write(output)
+  seconds = float(re.search(r'took ([0-9.]+) seconds', output).group(1))
+  return os.path.join(output_dir, output_filename), seconds
+
+#***************************************************************
+def main():
+  """"""
+
+  argparser = ArgumentParser('Compare the parsing speed and accuracy of two trained models (e.g. with and without SubtokenVocab gate_count)')
+  argparser.add_argument('baseline_dir')
+  argparser.add_argument('save_dir')
+  argparser.add_argument('conllu_file')
+  argparser.add_argument('--output_dir')
+  args = argparser.parse_args()
+
+  gold = ud_eval.load_conllu_file(args.conllu_file)
+  n_words = len(gold.words)
+  evaluations = []
+  speeds = []
+  for i, save_dir in enumerate((args.baseline_dir, args.save_dir)):
+    output_dir = args.output_dir or os.path.join(save_dir, 'compared')
+    output_filename = '{}.{}'.format(i, os.path.basename(args.conllu_file))
+    system_file, seconds = parse(save_dir, args.conllu_file, output_dir, output_filename)
+    evaluations.append(ud_eval.evaluate(gold, ud_eval.load_conllu_file(system_file)))
+    speeds.append(n_words / max(seconds, 1e-3))
+
+  print('{:8s} {:>10s} {:>10s} {:>10s}'.format('Metric', 'Baseline', 'Model', 'Delta'))
+  print('{:8s} {:10.0f} {:10.0f} {:+9.1f}%'.format('Words/s', speeds[0], speeds[1], 100 * (speeds[1] / speeds[0] - 1)))
+  for metric in metrics:
+    baseline_f1 = 100 * evaluations[0][metric].f1
+    f1 = 100 * evaluations[1][metric].f1
+    print('{:8s} {:10.2f} {:10.2f} {:+10.2f}'.format(metric, baseline_f1, f1, f1 - baseline_f1))
+  return
+
+if __name__ == '__main__':
+  """"""
+
+  main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Copyright 2017 Timothy Dozat
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+
+import numpy as np
+
+#***************************************************************
+def eisner(probs, lengths):
+  """"""
+
+  # Projective decoding of a whole bucket at once. probs[b, dep, head] are
+  # the head probabilities of sentence b (position 0 is the root), and the
+  # returned heads have the same layout as chuliu_edmonds_one_root's trees.
+  # Spans over the words are filled in one width at a time, with every span
+  # of that width in every sentence maximized over its splits in one go.
+  # The root is attached to exactly one word at the end.
+  n, m = probs.shape[:2]
+  lengths = np.asarray(lengths)
+  # (n x m x m) scores[b, head, dep]
+  scores = np.log(np.maximum(probs.astype(np.float64), np.finfo(np.float64).tiny)).transpose(0, 2, 1)
+
+  # complete_right[b,i,j]: i heads everything up to j; complete_left[b,i,j]: j heads everything back to i
+  # incomplete[b,i,j]: i and j are attached to each other, with the split kept in split_incomplete
+  complete_right = np.full((n, m, m), -np.inf)
+  complete_left = np.full((n, m, m), -np.inf)
+  incomplete = np.full((n, m, m), -np.inf)
+  complete_right[:, np.arange(m), np.arange(m)] = 0
+  complete_left[:, np.arange(m), np.arange(m)] = 0
+  split_incomplete = np.zeros((n, m, m), dtype=np.int32)
+  split_right = np.zeros((n, m, m), dtype=np.int32)
+  split_left = np.zeros((n, m, m), dtype=np.int32)
+
+  for width in range(1, m-1):
+    # (s) spans of this width over the words; (s x w) their splits
+    starts = np.arange(1, m-width)
+    ends = starts + width
+    splits = starts[:,None] + np.arange(width)[None,:]
+    # (n x s x w) -> (n x s)
+    span_scores = complete_right[:, starts[:,None], splits] + complete_left[:, splits+1, ends[:,None]]
+    best = np.argmax(span_scores, axis=-1)
+    span_scores = np.take_along_axis(span_scores, best[...,None], axis=-1)[...,0]
+    split_incomplete[:, starts, ends] = split_incomplete[:, ends, starts] = starts + best
+    incomplete[:, starts, ends] = span_scores + scores[:, starts, ends]
+    incomplete[:, ends, starts] = span_scores + scores[:, ends, starts]
+
+    # (n x s x w) -> (n x s)
+    span_scores = incomplete[:, starts[:,None], splits+1] + complete_right[:, splits+1, ends[:,None]]
+    best = np.argmax(span_scores, axis=-1)
+    complete_right[:, starts, ends] = np.take_along_axis(span_scores, best[...,None], axis=-1)[...,0]
+    split_right[:, starts, ends] = starts + 1 + best
+    span_scores = complete_left[:, starts[:,None], splits] + incomplete[:, ends[:,None], splits]
+    best = np.argmax(span_scores, axis=-1)
+    complete_left[:, starts, ends] = np.take_along_axis(span_scores, best[...,None], axis=-1)[...,0]
+    split_left[:, starts, ends] = starts + best
+
+  # (n x m) the score of each word being the only dependent of the root
+  last_words = np.maximum(lengths-1, 1)
+  root_scores = complete_left[:, 1] + complete_right[np.arange(n), :, last_words] + scores[:, 0]
+  root_scores[np.arange(m)[None,:] > last_words[:,None]] = -np.inf
+  root_scores[:, 0] = -np.inf
+  roots = np.argmax(root_scores, axis=-1)
+
+  # Follow the splits back down; heads are set when an incomplete span is reached
+  heads = np.zeros((n, m), dtype=np.int32)
+  for b, (root, last_word) in enumerate(zip(roots, last_words)):
+    if lengths[b] < 2:
+      continue
+    heads[b, root] = 0
+    stack = [(0, 1, root), (1, root, last_word)]
+    while stack:
+      kind, i, j = stack.pop()
+      if i == j:
+        continue
+      if kind == 0:
+        k = split_left[b, i, j]
+        heads[b, k] = j
+        stack.extend([(0, i, k), (2, k, j)])
+      elif kind == 1:
+        k = split_right[b, i, j]
+        heads[b, k] = i
+        stack.extend([(2, i, k), (1, k, j)])
+      else:
+        lo, hi = min(i, j), max(i, j)
+        k = split_incomplete[b, lo, hi]
+        stack.extend([(1, lo, k), (0, k+1, hi)])
+  return heads
+
+#***************************************************************
+def is_projective(tree):
+  """"""
+
+  arcs = [(min(dep, head), max(dep, head)) for dep, head in enumerate(tree) if dep > 0]
+  for (i, j), (k, l) in itertools.combinations(arcs, 2):
+    if i < k < j < l or k < i < l < j:
+      return False
+  return True
+
+#***************************************************************
+def main(n_trials=100, max_len=6, seed=0):
+  """"""
+
+  # Check against every projective single-root tree of some short sentences
+  random = np.random.RandomState(seed)
+  for i in range(n_trials):
+    lengths = random.randint(2, max_len+1, size=4)
+    m = lengths.max()
+    probs = np.exp(random.randn(len(lengths), m, m) * 2)
+    probs /= probs.sum(axis=-1, keepdims=True)
+    heads = eisner(probs, lengths)
+    for b, length in enumerate(lengths):
+      log_probs = np.log(probs[b, :length, :length])
+      best_score, best_tree = -np.inf, None
+      for tree in itertools.product(range(length), repeat=length-1):
+        tree = (0,) + tree
+        if sum(head == 0 for head in tree[1:]) != 1 or any(head == dep for dep, head in enumerate(tree) if dep > 0):
+          continue
+        # Every word has to reach the root
+        if not all(_reaches_root(tree, dep) for dep in range(1, length)):
+          continue
+        if not is_projective(tree):
+          continue
+        score = log_probs[np.arange(1, length), tree[1:]].sum()
+        if score > best_score:
+          best_score, best_tree = score, tree
+      score = log_probs[np.arange(1, length), heads[b, 1:length]].sum()
+      assert is_projective(heads[b, :length]), heads[b, :length]
+      assert np.isclose(score, best_score), (heads[b, :length], best_tree)
+  print('{} batches matched the best projective trees'.format(n_trials))
+  return
+
+#===============================================================
+def _reaches_root(tree, dep):
+  seen = set()
+  while dep != 0:
+    if dep in seen:
+      return False
+    seen.add(dep)
+    dep = tree[dep]
+  return True
+
+#***************************************************************
+if __name__ == '__main__':
+  """"""
+
+  main()
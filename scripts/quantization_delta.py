@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Copyright 2017 Timothy Dozat
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import subprocess
+from argparse import ArgumentParser
+
+import scripts.conll18_ud_eval as ud_eval
+
+metrics = ('UPOS', 'XPOS', 'UFeats', 'Lemmas', 'UAS', 'LAS')
+
+#***************************************************************
+def parse(save_dir, conllu_file, output_dir, output_filename, quantize):
+  """"""
+
+  # Each run gets its own process so that the two graphs never share a session
+  command = [sys.executable, 'main.py', '--save_dir', save_dir,
+             'run', conllu_file,
+             '--output_dir', output_dir,
+             '--output_filename', output_filename,
+             '--PretrainedVocab', 'quantize={}'.format(quantize)]
+  subprocess.check_call(command)
+  return os.path.join(output_dir, output_filename)
+
+#***************************************************************
+def main():
+  """"""
+
+  argparser = ArgumentParser('Compare a model with float and int8-quantized pretrained embeddings')
+  argparser.add_argument('save_dir')
+  argparser.add_argument('conllu_file')
+  argparser.add_argument('--output_dir')
+  args = argparser.parse_args()
+  output_dir = args.output_dir or os.path.join(args.save_dir, 'quantization')
+
+  gold = ud_eval.load_conllu_file(args.conllu_file)
+  evaluations = []
+  for quantize in (False, True):
+    output_filename = '{}.{}'.format('quantized' if quantize else 'float', os.path.basename(args.conllu_file))
+    system = ud_eval.load_conllu_file(parse(args.save_dir, args.conllu_file, output_dir, output_filename, quantize))
+    evaluations.append(ud_eval.evaluate(gold, system))
+
+  print('{:8s} {:>8s} {:>8s} {:>8s}'.format('Metric', 'Float', 'Int8', 'Delta'))
+  for metric in metrics:
+    float_f1 = 100 * evaluations[0][metric].f1
+    quantized_f1 = 100 * evaluations[1][metric].f1
+    print('{:8s} {:8.2f} {:8.2f} {:+8.2f}'.format(metric, float_f1, quantized_f1, quantized_f1 - float_f1))
+  return
+
+if __name__ == '__main__':
+  """"""
+
+  main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Copyright 2017 Timothy Dozat
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+from parser.structs.vocabs.pretrained_vocabs import PretrainedVocab
+
+#***************************************************************
+def test_parse_chunk():
+  """"""
+
+  tokens, embeddings = PretrainedVocab.parse_chunk(b'a 1 2 3\nb 4 5 6\r\n\nc 7 8 9', 3)
+  assert tokens == [u'a', u'b', u'c']
+  np.testing.assert_array_equal(embeddings, [[1,2,3], [4,5,6], [7,8,9]])
+  assert embeddings.dtype == np.float32
+  return
+
+#***************************************************************
+def test_parse_chunk_drops_malformed_lines():
+  """"""
+
+  # One extra value and one missing value add up to the right total
+  tokens, embeddings = PretrainedVocab.parse_chunk(b'a 1 2 3\nb 4 5 6 7\nc 8 9\nd 1 1 1\n', 3)
+  assert tokens == [u'a', u'd']
+  np.testing.assert_array_equal(embeddings, [[1,2,3], [1,1,1]])
+
+  # Irregular whitespace is fine as long as the line has the right number of fields
+  tokens, embeddings = PretrainedVocab.parse_chunk(b' x 1 2\ne  1 2 3\nf\t4 5 6 \n', 3)
+  assert tokens == [u'e', u'f']
+  np.testing.assert_array_equal(embeddings, [[1,2,3], [4,5,6]])
+
+  tokens, embeddings = PretrainedVocab.parse_chunk(b'g 1 2\n', 3)
+  assert tokens == []
+  assert embeddings.shape == (0, 3)
+  return
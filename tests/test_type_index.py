@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# Copyright 2017 Timothy Dozat
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import importlib.util
+from collections import Counter
+
+import numpy as np
+import pytest
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+#***************************************************************
+def load_type_index():
+  """"""
+
+  # Importing anything under parser/ imports tensorflow, so the module is loaded from its file
+  spec = importlib.util.spec_from_file_location('type_index', os.path.join(ROOT_DIR, 'parser', 'structs', 'vocabs', 'type_index.py'))
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module.TypeIndex
+
+TypeIndex = load_type_index()
+
+#***************************************************************
+def test_rows_and_extra_types():
+  """"""
+
+  computed = []
+  def compute_types(keys):
+    computed.extend(keys)
+    return np.array([[len(key[1])] for key in keys], dtype=np.float32).reshape([-1, 1])
+
+  type_index = TypeIndex(compute_types, cache_size=2)
+  keys = type_index.build([(1, u'The'), (1, u'the'), (2, u'dog'), (1, u'the')])
+  assert keys == [(1, u'The'), (1, u'the'), (2, u'dog')]
+  assert len(type_index) == 3
+
+  # Unknown types go after the table in the order they come
+  rows, extra_keys = type_index.get_rows([(1, u'the'), (0, u'Cat'), (1, u'The'), (0, u'bird')])
+  assert rows.tolist() == [1, 3, 0, 4]
+  assert extra_keys == [(0, u'Cat'), (0, u'bird')]
+  np.testing.assert_array_equal(type_index.get_extra_types(extra_keys), [[3], [4]])
+  assert computed == extra_keys
+
+  # Cached types aren't computed again, and the least recently used one is dropped
+  np.testing.assert_array_equal(type_index.get_extra_types([(0, u'bird'), (0, u'fish')]), [[4], [4]])
+  assert computed == extra_keys + [(0, u'fish')]
+  assert list(type_index.cache) == [(0, u'bird'), (0, u'fish')]
+
+  assert type_index.get_extra_types([]).shape == (0, 1)
+  return
+
+#***************************************************************
+def test_capitalized_types_hit_the_type_table(tmpdir):
+  """"""
+
+  pytest.importorskip('tensorflow')
+  from parser.config import Config
+  from parser.structs.vocabs import FormTokenVocab, FormSubtokenVocab
+
+  config = Config(defaults_file=os.path.join(ROOT_DIR, 'config', 'defaults.cfg'), DEFAULT={'save_dir': str(tmpdir)})
+
+  # The cased types are saved with the token vocab at train time and loaded back at parse time
+  token_vocab = FormTokenVocab(config=config)
+  token_vocab.add_counts(Counter({u'The': 4, u'the': 4, u'dog': 7, u'Rare': 1}))
+  token_vocab.index_by_counts()
+  token_vocab = FormTokenVocab(config=config)
+  assert token_vocab.load()
+  assert token_vocab.cased_types == [u'The']
+
+  subtoken_vocab = FormSubtokenVocab(config=config)
+  subtoken_vocab.add_counts(Counter({u'The': 4, u'the': 4, u'dog': 7, u'Rare': 1}))
+  subtoken_vocab.index_by_counts(dump=False)
+  subtoken_vocab.open()
+  vocabs = [token_vocab, subtoken_vocab]
+
+  type_index = TypeIndex(lambda keys: np.zeros([len(keys), 2], dtype=np.float32), cache_size=10)
+  tokens = token_vocab.cased_types + [token_vocab[index] for index in sorted(token_vocab._idx2str)]
+  type_index.build(TypeIndex.encode_keys(vocabs, tokens))
+
+  words = [u'The', u'the', u'dog', u'Cat', u'The']
+  indices = np.stack([token_vocab.encode_batch(words), subtoken_vocab.encode_batch(words)], axis=-1)[None]
+  keys, inverse_indices = TypeIndex.get_keys(vocabs, indices)
+  rows, extra_keys = type_index.get_rows(keys)
+  rows = rows[inverse_indices][0]
+  the = token_vocab[u'the']
+  assert rows[0] == rows[4] == type_index.rows[(the, u'The')]
+  assert rows[1] == type_index.rows[(the, u'the')]
+  assert rows[2] == type_index.rows[(token_vocab[u'dog'], u'dog')]
+  # Only the word that isn't in the token vocab needs computing
+  assert rows[3] == len(type_index)
+  assert extra_keys == [(token_vocab.UNK_IDX, u'Cat')]
+  return